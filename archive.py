@@ -0,0 +1,218 @@
+"""Append-only, compressed chat transcripts and a memory-mapped reader.
+
+An archive file is a sequence of frames, each a fixed header followed by a
+zlib-compressed JSON payload:
+
+* ``A`` frames add authors to the file's intern table as
+  ``[channelId, displayName]`` pairs; later frames refer to authors by
+  their index in that table.
+* ``M`` frames hold a block of messages as columns (``ts``, ``author``,
+  ``type``, ``text``). The header records the block's time range so
+  readers can skip blocks without decompressing them.
+
+A torn frame at the end, left by a crash, is ignored by the reader and
+cut off when the writer reopens the file.
+
+    python archive.py .youbot/archive/<chat>.log --author viewer1 --grep hello
+"""
+import argparse
+import datetime
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+# kind, payload length, record count, first and last timestamp
+FRAME = struct.Struct('<cIIdd')
+AUTHORS = b'A'
+MESSAGES = b'M'
+
+
+class ArchiveReader:
+    """Memory-mapped reader for an archive file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.authors = []
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.blocks = []
+        self.end = 0
+        self._scan()
+
+    def _scan(self):
+        offset = 0
+        size = len(self._map)
+        while offset + FRAME.size <= size:
+            kind, length, count, first, last = FRAME.unpack_from(self._map, offset)
+            start = offset + FRAME.size
+            if start + length > size:
+                break
+            if kind == AUTHORS:
+                self.authors.extend(json.loads(zlib.decompress(self._map[start:start + length])))
+            elif kind == MESSAGES:
+                self.blocks.append((start, length, count, first, last))
+            offset = start + length
+        self.end = offset
+
+    def __len__(self):
+        return sum(block[2] for block in self.blocks)
+
+    def messages(self, since=None, until=None, author=None):
+        """Yield ``(ts, channel_id, display_name, type, text)`` tuples in file order"""
+        for start, length, count, first, last in self.blocks:
+            if (since is not None and last < since) or (until is not None and first > until):
+                continue
+            columns = json.loads(zlib.decompress(self._map[start:start + length]))
+            types = columns['types']
+            for ts, author_index, type_index, text in zip(
+                    columns['ts'], columns['author'], columns['type'], columns['text']):
+                if (since is not None and ts < since) or (until is not None and ts > until):
+                    continue
+                channel_id, display_name = self.authors[author_index]
+                if author is not None and author not in (channel_id, display_name):
+                    continue
+                yield ts, channel_id, display_name, types[type_index], text
+
+    def close(self):
+        if self._map:
+            self._map.close()
+        self._file.close()
+
+
+class ChatArchive:
+    """Stream chat messages to an archive file from a background thread.
+
+    ``append`` only puts the message on a queue, so archiving adds no
+    measurable work to the live reply path. The writer thread batches
+    messages into blocks of ``block_size`` and writes at least every
+    ``flush_interval`` seconds.
+    """
+
+    def __init__(self, path, block_size=1000, flush_interval=5, level=6):
+        self.path = path
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self.level = level
+        self._queue = queue.SimpleQueue()
+        self._author_index = {}
+        self._open()
+        self._thread = threading.Thread(target=self._run, name='archive', daemon=True)
+        self._thread.start()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        end = 0
+        if os.path.exists(self.path):
+            reader = ArchiveReader(self.path)
+            for index, (channel_id, display_name) in enumerate(reader.authors):
+                self._author_index[channel_id, display_name] = index
+            end = reader.end
+            reader.close()
+        # Unbuffered, so a failed write leaves nothing behind to resurface later
+        self._file = open(self.path, 'ab', buffering=0)
+        self._file.truncate(end)
+
+    def append(self, message):
+        """Queue a ChatMessage for writing"""
+        self._queue.put(message)
+
+    def close(self):
+        """Write everything queued so far and stop the writer thread"""
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                message = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                message = False
+            if message:
+                batch.append(message)
+            if message is None or len(batch) >= self.block_size or time.monotonic() >= deadline:
+                try:
+                    self._write_block(batch)
+                except Exception as e:
+                    print(f"Error writing chat archive {self.path}: {str(e)}")
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+            if message is None:
+                return
+
+    def _frame(self, kind, payload, count, first=0.0, last=0.0):
+        data = zlib.compress(json.dumps(payload, separators=(',', ':')).encode(), self.level)
+        return FRAME.pack(kind, len(data), count, first, last) + data
+
+    def _write_block(self, batch):
+        if not batch:
+            return
+        # New authors only join the index once their frame is on disk, so
+        # a failed write never leaves later blocks pointing past the file
+        new_authors = {}
+        columns = {'ts': [], 'author': [], 'types': [], 'type': [], 'text': []}
+        type_index = {}
+        for message in batch:
+            key = (message.channel_id, message.author)
+            index = self._author_index.get(key)
+            if index is None:
+                index = new_authors.get(key)
+                if index is None:
+                    index = new_authors[key] = len(self._author_index) + len(new_authors)
+            if message.type not in type_index:
+                type_index[message.type] = len(columns['types'])
+                columns['types'].append(message.type)
+            columns['ts'].append(message.timestamp() or 0.0)
+            columns['author'].append(index)
+            columns['type'].append(type_index[message.type])
+            columns['text'].append(message.text)
+
+        data = b''
+        if new_authors:
+            data += self._frame(AUTHORS, [list(key) for key in new_authors], len(new_authors))
+        data += self._frame(MESSAGES, columns, len(batch), min(columns['ts']), max(columns['ts']))
+        end = os.fstat(self._file.fileno()).st_size
+        try:
+            if self._file.write(data) != len(data):
+                raise OSError(f"short write to {self.path}")
+        except OSError:
+            # Drop a partly written frame so the file stays readable
+            self._file.truncate(end)
+            raise
+        self._author_index.update(new_authors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query a chat archive")
+    parser.add_argument('path')
+    parser.add_argument('--author', help="channel ID or display name")
+    parser.add_argument('--since', type=float, help="epoch seconds")
+    parser.add_argument('--until', type=float, help="epoch seconds")
+    parser.add_argument('--grep', help="case-insensitive text filter")
+    parser.add_argument('--count', action='store_true', help="only print the number of matches")
+    args = parser.parse_args()
+
+    reader = ArchiveReader(args.path)
+    needle = args.grep.lower() if args.grep else None
+    matches = 0
+    for ts, channel_id, display_name, message_type, text in reader.messages(args.since, args.until, args.author):
+        if needle and needle not in text.lower():
+            continue
+        matches += 1
+        if not args.count:
+            when = datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+            print(f"{when} {display_name}: {text}")
+    print(f"{matches} of {len(reader)} messages, {len(reader.authors)} authors")
+    reader.close()
+
+
+if __name__ == "__main__":
+    main()
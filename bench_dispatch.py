@@ -0,0 +1,59 @@
+"""Micro-benchmark: CommandRegistry vs the old substring if/elif chain.
+
+Run with ``python bench_dispatch.py``. Needs no credentials or network.
+"""
+import random
+import time
+import timeit
+
+from commands import default_registry
+
+WORDS = ("hey", "lol", "nice", "stream", "gg", "what", "is", "this", "song",
+         "helpful", "hello", "!time", "pog", "wow", "chat", "first")
+
+
+def legacy_chain(author, text, custom=()):
+    """The substring chain process_message used before the registry"""
+    text = text.lower()
+    if 'hello' in text:
+        return f"Hello {author}! 👋"
+    elif 'help' in text:
+        return "Available commands: !help, !about, !time"
+    elif '!about' in text:
+        return "I'm a YouTube chatbot using minimal permissions!"
+    elif '!time' in text:
+        return f"Current time: {time.strftime('%H:%M:%S')}"
+    for trigger, reply in custom:
+        if trigger in text:
+            return reply
+    return None
+
+
+def make_messages(count, seed=1):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+            for _ in range(count)]
+
+
+def bench(label, func, messages, repeat=5):
+    best = min(timeit.repeat(lambda: [func("viewer", m) for m in messages],
+                             number=1, repeat=repeat))
+    print(f"{label:<32} {best / len(messages) * 1e6:8.3f} us/msg")
+
+
+def main():
+    messages = make_messages(20000)
+    custom = [(f"!cmd{i}", f"reply {i}") for i in range(500)]
+
+    registry = default_registry()
+    bench("chain, 4 commands", legacy_chain, messages)
+    bench("registry, 4 commands", registry.dispatch, messages)
+
+    for trigger, reply in custom:
+        registry.register(trigger, lambda author, text, reply=reply: reply, prefixes=[trigger])
+    bench("chain, 504 commands", lambda a, t: legacy_chain(a, t, custom), messages)
+    bench("registry, 504 commands", registry.dispatch, messages)
+
+
+if __name__ == "__main__":
+    main()
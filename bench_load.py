@@ -0,0 +1,93 @@
+"""Load test: drive YouTubeAPIBot against the local fake API server.
+
+Reports messages/sec processed, reply latency percentiles (from the
+answered message's publish time to a successful insert) and API calls per
+reply. Needs no credentials or network.
+
+    python bench_load.py --streams 20 --rate 30 --duration 30
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+
+from engine import ChatEngine
+from fake_server import FakeYouTube, FakeYouTubeServer
+from main import YouTubeAPIBot
+from outbox import TokenBucket
+from transport import RequestsTransport
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def drive(bot, streams, duration, send_rate):
+    loop = asyncio.get_running_loop()
+    latencies = []
+
+    def on_sent(reply):
+        if reply.origin:
+            latencies.append(time.time() - reply.origin)
+
+    engines = []
+    for index in range(streams):
+        live_chat_id = await asyncio.to_thread(bot.get_live_chat_id, f"video{index}")
+        engines.append(ChatEngine(bot, live_chat_id, bucket=TokenBucket(send_rate, send_rate),
+                                  stats_interval=duration + 60, on_sent=on_sent))
+
+    tasks = [asyncio.create_task(engine.run()) for engine in engines]
+    started = loop.time()
+    await asyncio.sleep(duration)
+    for engine in engines:
+        engine.stop()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    dropped = sum(engine.outbox.stats['dropped'] for engine in engines)
+    merged = sum(engine.outbox.stats['merged'] for engine in engines)
+    return latencies, loop.time() - started, dropped, merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--streams', type=int, default=5)
+    parser.add_argument('--rate', type=float, default=20, help="messages per second per chat")
+    parser.add_argument('--latency', type=float, default=0.05, help="fake API seconds per request")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--interval', type=int, default=1000, help="pollingIntervalMillis")
+    parser.add_argument('--send-rate', type=float, default=2, help="replies per second per chat")
+    parser.add_argument('--duration', type=float, default=15, help="seconds")
+    args = parser.parse_args()
+
+    fake = FakeYouTube(args.rate, args.latency, error_rate=args.error_rate,
+                       polling_interval=args.interval)
+    server = FakeYouTubeServer(fake).start()
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        bot = YouTubeAPIBot(transport=RequestsTransport(pool_size=args.streams * 2),
+                            api_endpoint=server.url, state_dir=state_dir)
+        bot.build_client()
+        latencies, elapsed, dropped, merged = asyncio.run(
+            drive(bot, args.streams, args.duration, args.send_rate)
+        )
+    server.shutdown()
+
+    stats = fake.stats()
+    api_calls = sum(stats['calls'].values())
+    replies = stats['inserted']
+    print(f"streams:            {args.streams} x {args.rate:g} msg/s for {elapsed:.1f}s")
+    print(f"messages processed: {stats['delivered']} ({stats['delivered'] / elapsed:.1f} msg/s)")
+    print(f"replies sent:       {replies} for {stats['triggers']} triggers "
+          f"({merged} merged, {dropped} dropped)")
+    print(f"reply latency:      p50 {percentile(latencies, 0.5):.3f}s  "
+          f"p90 {percentile(latencies, 0.9):.3f}s  p99 {percentile(latencies, 0.99):.3f}s")
+    print(f"API calls:          {api_calls} ({api_calls / max(replies, 1):.2f} per reply)")
+    for endpoint, count in sorted(stats['calls'].items()):
+        print(f"  {endpoint:<24} {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class LookupCache:
+    """Small persistent key/value cache with per-entry TTL and LRU eviction.
+
+    Entries live in one JSON file that is replaced atomically, so a
+    restarted bot can reuse earlier lookups instead of repeating API calls.
+    Writes are batched: ``set`` writes the file at most every
+    ``flush_interval`` seconds, and ``flush()`` forces it.
+    """
+
+    def __init__(self, path, max_entries=1000, flush_interval=5):
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._dirty = False
+        self._flushed = 0
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        now = time.time()
+        return {key: entry for key, entry in entries.items() if entry.get('expires', 0) > now}
+
+    def get(self, key):
+        """Return the cached value, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            now = time.time()
+            if entry['expires'] <= now:
+                del self._entries[key]
+                self._dirty = True
+                return None
+            entry['used'] = now
+            return entry['value']
+
+    def set(self, key, value, ttl):
+        """Cache ``value`` for ``ttl`` seconds"""
+        with self._lock:
+            now = time.time()
+            self._entries[key] = {'value': value, 'expires': now + ttl, 'used': now}
+            if len(self._entries) > self.max_entries:
+                oldest = sorted(self._entries, key=lambda k: self._entries[k]['used'])
+                for stale in oldest[:len(self._entries) - self.max_entries]:
+                    del self._entries[stale]
+            self._dirty = True
+        self.flush(force=False)
+
+    def delete(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._dirty = True
+        self.flush(force=False)
+
+    def flush(self, force=True):
+        """Write the cache to disk if it changed"""
+        with self._lock:
+            now = time.time()
+            if not self._dirty or (not force and now - self._flushed < self.flush_interval):
+                return
+            data = json.dumps(self._entries)
+            self._dirty = False
+            self._flushed = now
+
+        directory = os.path.dirname(self.path) or '.'
+        with self._write_lock:
+            try:
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.cache-')
+                with os.fdopen(fd, 'w') as f:
+                    f.write(data)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Error writing cache {self.path}: {str(e)}")
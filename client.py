@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+
+# The only parts of the YouTube API the bot calls
+RESOURCES = ('videos', 'channels', 'liveChatMessages')
+
+
+def _refs(node):
+    """Yield every schema ``$ref`` inside a discovery document node"""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == '$ref':
+                yield value
+            else:
+                yield from _refs(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _refs(value)
+
+
+def trim_discovery(doc, resources=RESOURCES):
+    """Cut a discovery document down to ``resources`` and the schemas they use"""
+    doc = dict(doc)
+    doc['resources'] = {name: doc['resources'][name] for name in resources}
+    schemas = doc.get('schemas', {})
+    keep = set()
+    pending = list(_refs(doc['resources']))
+    while pending:
+        name = pending.pop()
+        if name in keep or name not in schemas:
+            continue
+        keep.add(name)
+        pending.extend(_refs(schemas[name]))
+    doc['schemas'] = {name: schemas[name] for name in keep}
+    return doc
+
+
+def load_discovery(cache_dir):
+    """Return the trimmed YouTube discovery document, cached in ``cache_dir``"""
+    from googleapiclient.version import __version__
+    path = os.path.join(cache_dir, f"youtube.v3.{__version__}.json")
+    try:
+        with open(path) as f:
+            document = json.load(f)
+        if isinstance(document, dict) and 'resources' in document:
+            return document
+        raise ValueError("not a discovery document")
+    except OSError:
+        pass
+    except ValueError as e:
+        # A torn or corrupt cache is rebuilt instead of failing every start
+        print(f"Discarding bad cached discovery document: {str(e)}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    from googleapiclient.discovery_cache import get_static_doc
+    document = trim_discovery(json.loads(get_static_doc('youtube', 'v3')))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Sharded workers may all build the cache at once, so each writes
+        # its own temporary file
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.discovery-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(document, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error caching discovery document: {str(e)}")
+    return document
+
+
+def build_youtube(http, cache_dir, api_endpoint=None):
+    """Build the YouTube client over ``http`` from the cached discovery document.
+
+    Skips parsing the full document that ``build('youtube', 'v3')`` would
+    load on every start, and falls back to it if the cache cannot be made.
+    ``api_endpoint`` points the client at another server, such as the
+    local fake in fake_server.py.
+    """
+    client_options = {'api_endpoint': api_endpoint} if api_endpoint else None
+    from googleapiclient.discovery import build, build_from_document
+    try:
+        return build_from_document(load_discovery(cache_dir), http=http, client_options=client_options)
+    except Exception as e:
+        print(f"Error loading cached discovery document: {str(e)}")
+        return build('youtube', 'v3', http=http, cache_discovery=False,
+                     client_options=client_options)
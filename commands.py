@@ -0,0 +1,310 @@
+import json
+import os
+import re
+import string
+import threading
+import time
+
+_WORD = re.compile(r'!?\w+')
+
+
+class Command:
+    """A chat command and the handler that builds its reply.
+
+    ``priority`` orders replies in the outbox (lower goes first) and
+    ``merge(authors)``, if set, renders one reply for several authors.
+    ``kind`` says where the handler runs (see ``handlers.HandlerPool``),
+    ``timeout`` how long its reply is waited for, and ``cooldown`` the
+    minimum seconds between two replies to it in one chat.
+    """
+
+    __slots__ = ('name', 'handler', 'order', 'priority', 'merge', 'kind', 'timeout', 'cooldown')
+
+    def __init__(self, name, handler, order, priority=10, merge=None, kind='inline', timeout=5,
+                 cooldown=0):
+        self.name = name
+        self.handler = handler
+        self.order = order
+        self.priority = priority
+        self.merge = merge
+        self.kind = kind
+        self.timeout = timeout
+        self.cooldown = cooldown
+
+
+def _order(command):
+    return command.order
+
+
+class CommandRegistry:
+    """Dispatch chat messages to commands in a single pass.
+
+    Triggers are whole words, either ``!command`` prefixes or bare keywords,
+    compiled into one lookup table. When several commands match, the one
+    registered first wins. With up to ``SCAN_LIMIT`` distinct trigger words,
+    a message is first checked for each word as a plain substring, in
+    command order, and only words that occur are confirmed as whole words,
+    stopping at the first that no later command can beat. So most messages
+    cost a few substring checks, like the old if/elif chain. Larger
+    registries scan the message once instead, and each word costs one table
+    lookup however many commands are registered.
+    """
+
+    SCAN_LIMIT = 32
+
+    def __init__(self):
+        self.commands = []
+        self._table = {}
+        self._scan = []
+
+    def register(self, name, handler, prefixes=(), keywords=(), priority=10, merge=None,
+                 kind='inline', timeout=5, cooldown=0):
+        """Register ``handler(author, text)`` under ``!prefix`` and keyword triggers"""
+        command = Command(name, handler, len(self.commands), priority, merge, kind, timeout, cooldown)
+        for prefix in prefixes:
+            self._table.setdefault('!' + prefix.lstrip('!').lower(), command)
+        for keyword in keywords:
+            keyword = keyword.lower()
+            self._table.setdefault(keyword, command)
+            self._table.setdefault('!' + keyword, command)
+        self.commands.append(command)
+        self._compile()
+        return command
+
+    def _compile(self):
+        first = {}
+        for trigger, command in self._table.items():
+            word = trigger.lstrip('!')
+            first[word] = min(first.get(word, command.order), command.order)
+        if len(first) > self.SCAN_LIMIT:
+            self._scan = None
+            return
+        self._scan = sorted((order, word) for word, order in first.items())
+
+    def match(self, text):
+        """Return the command a message triggers, or None"""
+        text = text.lower()
+        if self._scan is None:
+            hits = self._table.keys() & _WORD.findall(text)
+            if not hits:
+                return None
+            return min((self._table[word] for word in hits), key=_order)
+
+        best = None
+        best_order = len(self.commands)
+        for order, word in self._scan:
+            if order >= best_order:
+                break
+            if word not in text:
+                continue
+            start = text.find(word)
+            while start >= 0:
+                end = start + len(word)
+                # Only a whole word counts, as _WORD would split it out,
+                # with a '!' right before it making it a prefix trigger
+                before = text[start - 1:start]
+                after = text[end:end + 1]
+                if not (before.isalnum() or before == '_' or after.isalnum() or after == '_'):
+                    command = self._table.get('!' + word if before == '!' else word)
+                    if command is not None and command.order < best_order:
+                        best = command
+                        best_order = command.order
+                        if best_order <= order:
+                            break
+                start = text.find(word, end)
+        return best
+
+    def dispatch(self, author, text):
+        """Return the reply to a message, or None"""
+        command = self.match(text)
+        if command is None:
+            return None
+        return command.handler(author, text)
+
+
+def default_registry():
+    """The bot's built-in commands"""
+    registry = CommandRegistry()
+    registry.register('hello', lambda author, text: f"Hello {author}! 👋", keywords=['hello'],
+                      priority=20, merge=lambda authors: f"Hello {', '.join(authors)}! 👋")
+    registry.register('help', lambda author, text: "Available commands: !help, !about, !time", keywords=['help'],
+                      cooldown=15)
+    registry.register('about', lambda author, text: "I'm a YouTube chatbot using minimal permissions!", prefixes=['about'],
+                      cooldown=15)
+    registry.register('time', lambda author, text: f"Current time: {time.strftime('%H:%M:%S')}", prefixes=['time'],
+                      priority=5, cooldown=5)
+    return registry
+
+
+# Fields a reply template may use; ``authors`` only in merge templates
+TEMPLATE_FIELDS = {'author', 'text', 'time', 'date'}
+MERGE_FIELDS = {'authors', 'time', 'date'}
+_CONFIG_KEYS = {'name', 'reply', 'merge', 'prefixes', 'keywords', 'priority', 'timeout', 'cooldown'}
+
+
+class Template:
+    """A ``str.format``-style reply template, parsed once when loaded.
+
+    Unknown fields and bad format specs fail at load time, so a bad config
+    never reaches chat.
+    Rendering joins the pre-split parts and only reads the clock when the
+    template uses ``{time}`` or ``{date}``.
+    """
+
+    __slots__ = ('source', 'fields', '_parts')
+
+    def __init__(self, source, allowed=TEMPLATE_FIELDS):
+        self.source = source
+        self.fields = set()
+        self._parts = []
+        for literal, field, spec, conversion in string.Formatter().parse(source):
+            if literal:
+                self._parts.append((literal, None, None))
+            if field is None:
+                continue
+            if field not in allowed or conversion:
+                raise ValueError(f"Unsupported field {{{field}}} in template {source!r}")
+            self.fields.add(field)
+            self._parts.append((None, field, spec))
+        # Format specs are only applied when rendering, so try one now
+        try:
+            self.render(**{field: 'sample' for field in allowed})
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid template {source!r}: {str(e)}")
+
+    def render(self, **values):
+        if 'time' in self.fields or 'date' in self.fields:
+            now = time.localtime()
+            values['time'] = time.strftime('%H:%M:%S', now)
+            values['date'] = time.strftime('%Y-%m-%d', now)
+        return ''.join(literal if field is None else format(values[field], spec)
+                       for literal, field, spec in self._parts)
+
+
+class TemplateReply:
+    """Command handler that renders a reply template"""
+
+    __slots__ = ('template',)
+
+    def __init__(self, template):
+        self.template = template
+
+    def __call__(self, author, text):
+        return self.template.render(author=author, text=text)
+
+
+class TemplateMerge:
+    """Merge function that renders one reply for several authors"""
+
+    __slots__ = ('template',)
+
+    def __init__(self, template):
+        self.template = template
+
+    def __call__(self, authors):
+        return self.template.render(authors=', '.join(authors))
+
+
+def _word_list(entry, key, kind):
+    """An entry's list of trigger words, each one whole ``_WORD`` token"""
+    words = entry.get(key, [])
+    if not isinstance(words, list):
+        raise ValueError(f"{key} of command {entry['name']!r} must be a list of words")
+    for word in words:
+        if not isinstance(word, str) or _WORD.fullmatch(word.lower()) is None:
+            raise ValueError(f"Invalid {kind} {word!r} in command {entry['name']!r}: "
+                             f"triggers are single words")
+    return words
+
+
+def _number(entry, key, default):
+    value = entry.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        raise ValueError(f"{key} of command {entry['name']!r} must be a non-negative number")
+    return value
+
+
+def registry_from_config(config):
+    """Build a CommandRegistry from a parsed commands config, raising ValueError if invalid"""
+    if not isinstance(config, dict) or not isinstance(config.get('commands', []), list):
+        raise ValueError("A commands config is an object with a list of commands")
+    registry = CommandRegistry()
+    for entry in config.get('commands', []):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Each command must be an object: {entry!r}")
+        unknown = set(entry) - _CONFIG_KEYS
+        if unknown:
+            raise ValueError(f"Unknown keys in command {entry.get('name')!r}: {', '.join(sorted(unknown))}")
+        if not isinstance(entry.get('name'), str) or not isinstance(entry.get('reply'), str):
+            raise ValueError(f"Command needs a name and a reply: {entry!r}")
+        merge = entry.get('merge')
+        if merge is not None and not isinstance(merge, str):
+            raise ValueError(f"merge of command {entry['name']!r} must be a template string")
+        prefixes = _word_list(entry, 'prefixes', 'prefix')
+        keywords = _word_list(entry, 'keywords', 'keyword')
+        if not prefixes and not keywords:
+            raise ValueError(f"Command {entry['name']!r} has no prefixes or keywords")
+        registry.register(
+            entry['name'],
+            TemplateReply(Template(entry['reply'])),
+            prefixes=prefixes,
+            keywords=keywords,
+            priority=_number(entry, 'priority', 10),
+            merge=TemplateMerge(Template(merge, MERGE_FIELDS)) if merge else None,
+            timeout=_number(entry, 'timeout', 5),
+            cooldown=_number(entry, 'cooldown', 0),
+        )
+    return registry
+
+
+def load_registry(path):
+    """Load a CommandRegistry from a JSON commands file"""
+    with open(path, encoding='utf-8') as f:
+        return registry_from_config(json.load(f))
+
+
+class CommandWatcher(threading.Thread):
+    """Reload a bot's commands whenever its commands file changes.
+
+    The new registry is built off to the side and swapped in with a single
+    attribute assignment, so polling never pauses and every message is
+    matched against either the old or the new commands, never a mix. A file
+    that fails to load is reported and the running commands are kept.
+    """
+
+    def __init__(self, bot, path, interval=2):
+        super().__init__(name='command-watcher', daemon=True)
+        self.bot = bot
+        self.path = path
+        self.interval = interval
+        self._mtime = self._stat()
+        self._stopped = threading.Event()
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def stop(self):
+        self._stopped.set()
+
+    def check(self):
+        """Reload if the file changed; return True if new commands were swapped in"""
+        mtime = self._stat()
+        if mtime is None or mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            registry = load_registry(self.path)
+        except Exception as e:
+            # Never let a bad file stop the watcher; the next edit is retried
+            print(f"Error reloading commands from {self.path}: {str(e)}")
+            return False
+        self.bot.commands = registry
+        print(f"Reloaded {len(registry.commands)} commands from {self.path}")
+        return True
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.check()
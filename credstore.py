@@ -0,0 +1,144 @@
+from contextlib import contextmanager
+import datetime
+import fcntl
+import json
+import os
+import tempfile
+import threading
+
+EXPIRY_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def _utcnow():
+    # google-auth keeps expiry as a naive UTC datetime
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def seconds_until_expiry(creds):
+    """Seconds the current access token stays valid; 0 if there is none"""
+    if not creds.token:
+        return 0
+    if creds.expiry is None:
+        return None
+    return (creds.expiry - _utcnow()).total_seconds()
+
+
+class CredentialStore:
+    """JSON credential store that several bot workers can share.
+
+    OAuth user credentials are stored in the ``Credentials.to_json``
+    format. For a service account, the key file stays the source of truth
+    and only the current access token and its expiry are stored. Plain JSON
+    loads fast and, unlike a pickle, cannot run code. Every access holds
+    an ``flock`` on a sidecar lock file, so workers never read a
+    half-written file and only one of them refreshes an expiring token.
+    """
+
+    def __init__(self, path, scopes, service_account_file=None):
+        self.path = path
+        self.scopes = scopes
+        self.service_account_file = service_account_file
+
+    @contextmanager
+    def _locked(self, exclusive):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, creds):
+        if hasattr(creds, 'service_account_email'):
+            data = {'type': 'service_account_token', 'token': creds.token}
+            if creds.expiry:
+                data['expiry'] = creds.expiry.strftime(EXPIRY_FORMAT)
+        else:
+            data = json.loads(creds.to_json())
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', prefix='.token-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, self.path)
+
+    def _adopt(self, creds, data):
+        """Copy a stored token into ``creds`` if it is newer; return True if adopted"""
+        if not data or not data.get('token') or not data.get('expiry'):
+            return False
+        expiry = datetime.datetime.strptime(data['expiry'].rstrip('Z').split('.')[0], EXPIRY_FORMAT[:-1])
+        if creds.expiry and expiry <= creds.expiry:
+            return False
+        creds.token = data['token']
+        creds.expiry = expiry
+        return True
+
+    def load(self):
+        """Load credentials, or raise if none are configured"""
+        with self._locked(exclusive=False):
+            data = self._read()
+
+        if self.service_account_file:
+            from google.oauth2 import service_account
+            creds = service_account.Credentials.from_service_account_file(
+                self.service_account_file, scopes=self.scopes
+            )
+            self._adopt(creds, data)
+            return creds
+
+        if not data:
+            raise ValueError(f"No credentials found in {self.path}")
+        from google.oauth2.credentials import Credentials
+        return Credentials.from_authorized_user_info(data, self.scopes)
+
+    def refresh(self, creds, margin=300):
+        """Refresh ``creds`` unless another worker already stored a fresh token"""
+        with self._locked(exclusive=True):
+            self._adopt(creds, self._read())
+            remaining = seconds_until_expiry(creds)
+            if remaining is not None and remaining > margin:
+                return
+            from google.auth.transport.requests import Request
+            creds.refresh(Request())
+            self._write(creds)
+
+
+class TokenRefresher(threading.Thread):
+    """Refresh credentials in the background ``margin`` seconds before they expire"""
+
+    def __init__(self, store, creds, margin=300, retry_delay=30, max_sleep=600):
+        super().__init__(name='token-refresher', daemon=True)
+        self.store = store
+        self.creds = creds
+        self.margin = margin
+        self.retry_delay = retry_delay
+        self.max_sleep = max_sleep
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.is_set():
+            remaining = seconds_until_expiry(self.creds)
+            if remaining is None:
+                wait = self.max_sleep
+            elif remaining > self.margin:
+                wait = min(remaining - self.margin, self.max_sleep)
+            else:
+                try:
+                    self.store.refresh(self.creds, self.margin)
+                    print("Access token refreshed")
+                    continue
+                except Exception as e:
+                    print(f"Error refreshing access token: {e}")
+                    wait = self.retry_delay
+            self._stopped.wait(wait)
@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+
+class SeenIndex:
+    """Bounded set of recently seen message IDs.
+
+    IDs go into a current generation. When it holds ``capacity / 2`` IDs
+    it becomes the previous generation, and the old previous generation is
+    dropped. Lookups are O(1), memory stays under ``capacity`` IDs however
+    long a stream runs, and the newest ``capacity / 2`` IDs are always
+    remembered.
+    """
+
+    def __init__(self, capacity=20000, path=None):
+        self.generation_size = max(1, capacity // 2)
+        self.path = path
+        self._current = set()
+        self._previous = set()
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self._current) + len(self._previous)
+
+    def __contains__(self, message_id):
+        return message_id in self._current or message_id in self._previous
+
+    def add(self, message_id):
+        """Remember an ID; return True if it had already been seen"""
+        if message_id in self._current or message_id in self._previous:
+            return True
+        self._current.add(message_id)
+        if len(self._current) >= self.generation_size:
+            self._previous = self._current
+            self._current = set()
+        return False
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    if line.strip():
+                        self.add(line.strip())
+        except OSError:
+            pass
+
+    def discard(self):
+        """Forget every ID and delete the snapshot"""
+        self._current = set()
+        self._previous = set()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def save(self):
+        """Write the IDs, oldest generation first, so a reload keeps their order"""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path) or '.'
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.seen-')
+            with os.fdopen(fd, 'w') as f:
+                for generation in (self._previous, self._current):
+                    f.writelines(message_id + '\n' for message_id in generation)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving seen message IDs to {self.path}: {str(e)}")
@@ -0,0 +1,411 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import time
+
+from messages import parse_items
+from metrics import metrics
+from archive import ChatArchive
+from dedup import SeenIndex
+from handlers import HandlerPool
+from outbox import Outbox
+from scheduler import PollScheduler
+from throttle import Throttle
+
+
+class _PageEnd:
+    """Inbox marker following the last message of a page"""
+
+    __slots__ = ('token',)
+
+    def __init__(self, token):
+        self.token = token
+
+
+def decide(bot, seen, throttle, message, now=None):
+    """Decide what to do with one chat message; return ``(decision, command)``.
+
+    The decision is 'duplicate', 'ignored', 'error' if matching failed,
+    'throttled', or 'handle' if ``command`` should run. Offline replay
+    decides with this too, so it matches live chat exactly.
+    """
+    if message.id and seen.add(message.id):
+        return 'duplicate', None
+    try:
+        command = bot.match_command(message)
+    except Exception as e:
+        print(f"Error processing message: {str(e)}")
+        return 'error', None
+    if command is None:
+        return 'ignored', None
+    if not throttle.allow(message.channel_id, command, now):
+        return 'throttled', command
+    return 'handle', command
+
+
+class ChatEngine:
+    """Drive one live chat with separate poll, process and send tasks.
+
+    The tasks are linked by bounded queues, so a slow
+    ``liveChatMessages().insert`` never holds up the next poll. Replies go
+    through an ``Outbox`` that rate-limits, prioritises and merges them.
+    Polls are timed by a ``PollScheduler`` and stop when the chat ends.
+    With ``prefetch``, the next page is fetched while the current one is
+    still being queued.
+    With a ``cache``, a page's token is saved once every message on that
+    page has been processed, so a restarted engine resumes at the first
+    page it had not finished. Message IDs go
+    into a bounded ``SeenIndex`` so redelivered messages are skipped; with a
+    ``state_dir`` it is saved to disk before each page token, so it covers
+    the resume point even after a restart that skipped all cleanup.
+    Matched commands must pass a per-viewer and per-command ``Throttle``
+    before any handler runs. Handlers run through a ``HandlerPool``, and
+    their replies are joined back in message order by a separate task, so
+    slow handlers never hold up polling. With an ``archive_dir``, every new message is also streamed
+    to a ``ChatArchive`` transcript. A ``quota`` planner stretches polls and
+    holds back low-priority replies when API quota runs short.
+    ``on_sent(reply)`` is called after each reply is sent.
+    """
+
+    def __init__(self, bot, live_chat_id, queue_size=500, senders=2, scheduler=None,
+                 bucket=None, stats_interval=60, cache=None, page_token_ttl=3600,
+                 on_sent=None, state_dir=None, seen_capacity=20000, handlers=None,
+                 archive_dir=None, throttle=None, quota=None, prefetch=True):
+        self.bot = bot
+        self.live_chat_id = live_chat_id
+        self.inbox = asyncio.Queue(queue_size)
+        self.pending = asyncio.Queue(queue_size)
+        self.handlers = handlers or HandlerPool()
+        self.throttle = throttle if throttle is not None else Throttle()
+        self.quota = quota
+        self.outbox = Outbox(bucket, maxsize=queue_size, gate=quota.allow_send if quota else None)
+        self.senders = senders
+        self.scheduler = scheduler or PollScheduler()
+        self.stats_interval = stats_interval
+        self.cache = cache
+        self.page_token_ttl = page_token_ttl
+        self.on_sent = on_sent
+        seen_path = os.path.join(state_dir, 'seen', f"{live_chat_id}.txt") if state_dir else None
+        self.seen = SeenIndex(seen_capacity, seen_path)
+        self.archive = ChatArchive(os.path.join(archive_dir, f"{live_chat_id}.log")) if archive_dir else None
+        self.next_page_token = cache.get(f"page:{live_chat_id}") if cache else None
+        self.prefetch = prefetch
+        self.ended = False
+        self._tasks = []
+
+    async def run(self):
+        """Run until the chat ends or the engine is cancelled"""
+        self._tasks = [
+            asyncio.create_task(self._poll()),
+            asyncio.create_task(self._process()),
+            asyncio.create_task(self._join()),
+            asyncio.create_task(self._maintain()),
+        ]
+        self._tasks += [asyncio.create_task(self._send()) for _ in range(self.senders)]
+        metrics.add_collector(self._collect)
+        try:
+            done, pending = await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+            # Polling finished because the chat ended; flush what is left
+            await self._drain()
+        finally:
+            self.stop()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            while not self.pending.empty():
+                self.pending.get_nowait()[0].cancel()
+            metrics.remove_collector(self._collect)
+            if self.ended:
+                self.seen.discard()
+            else:
+                self.seen.save()
+            if self.archive:
+                self.archive.close()
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+
+    def _collect(self):
+        labels = {'chat': self.live_chat_id}
+        yield 'inbox_depth', labels, self.inbox.qsize()
+        yield 'handlers_pending', labels, self.pending.qsize()
+        yield 'throttle_viewers', labels, len(self.throttle)
+        for name, value in self.outbox.snapshot().items():
+            yield f"outbox_{name}", labels, value
+
+    async def _drain(self, timeout=30):
+        try:
+            await asyncio.wait_for(self._until_idle(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _until_idle(self):
+        while not self.inbox.empty() or not self.pending.empty() or self.outbox.depth:
+            await asyncio.sleep(0.5)
+
+    async def _fetch(self, page_token, at):
+        """Fetch a chat page once the loop clock reaches ``at``.
+
+        Returns when the fetch started, and the response or the error.
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(max(0, at - loop.time()))
+        started = loop.time()
+        try:
+            with metrics.timer('poll'):
+                chat_data = await asyncio.to_thread(
+                    self.bot.fetch_chat_messages, self.live_chat_id, page_token
+                )
+        except Exception as e:
+            return started, None, e
+        return started, chat_data, None
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        fetch = asyncio.create_task(self._fetch(self.next_page_token, loop.time()))
+        try:
+            while True:
+                started, chat_data, error = await fetch
+                if error:
+                    print(f"Error getting chat messages: {str(error)}")
+                    delay = self.scheduler.on_error(error)
+                else:
+                    self.next_page_token = chat_data.get('nextPageToken')
+                    delay = self.scheduler.on_success(chat_data)
+
+                if delay is None:
+                    fetch = None
+                    await self._enqueue(chat_data)
+                    print(f"Live chat {self.live_chat_id} has ended")
+                    self.ended = True
+                    if self.cache:
+                        self.cache.delete(f"page:{self.live_chat_id}")
+                    return
+                if self.quota:
+                    delay = self.quota.stretch(delay)
+
+                # With prefetch the next page is requested as soon as its
+                # token is known, still no earlier than the interval allows,
+                # while this page is parsed and queued
+                if self.prefetch:
+                    fetch = asyncio.create_task(self._fetch(self.next_page_token, started + delay))
+                    await self._enqueue(chat_data)
+                else:
+                    await self._enqueue(chat_data)
+                    fetch = asyncio.create_task(self._fetch(self.next_page_token, started + delay))
+        finally:
+            if fetch:
+                fetch.cancel()
+
+    async def _enqueue(self, chat_data):
+        if not chat_data:
+            return
+        with metrics.timer('parse'):
+            messages = parse_items(chat_data.get('items', []))
+        metrics.inc('messages_total', len(messages))
+        for message in messages:
+            await self.inbox.put(message)
+        await self.inbox.put(_PageEnd(chat_data.get('nextPageToken')))
+
+    async def _process(self):
+        seen_changed = False
+        while True:
+            message = await self.inbox.get()
+            if isinstance(message, _PageEnd):
+                # Everything before the token is handled; resume after it.
+                # The seen IDs are saved first, so a bot killed without
+                # cleanup never resumes past messages it would answer again
+                if self.cache and message.token and not self.ended:
+                    if seen_changed:
+                        await asyncio.to_thread(self.seen.save)
+                        seen_changed = False
+                    self.cache.set(f"page:{self.live_chat_id}", message.token, self.page_token_ttl)
+                continue
+            with metrics.timer('dispatch'):
+                decision, command = decide(self.bot, self.seen, self.throttle, message)
+            if decision == 'duplicate':
+                metrics.inc('duplicates_total')
+                continue
+            if message.id:
+                seen_changed = True
+            if self.archive:
+                self.archive.append(message)
+            if decision == 'throttled':
+                metrics.inc('throttled_total', command=command.name)
+            if decision != 'handle':
+                continue
+            deadline = time.monotonic() + command.timeout
+            future = self.handlers.submit(command, message.author, message.text)
+            await self.pending.put((future, deadline, command, message))
+
+    async def _join(self):
+        while True:
+            future, deadline, command, message = await self.pending.get()
+            try:
+                response = await self.handlers.result(future, deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                print(f"Handler for {command.name} timed out")
+                metrics.inc('handler_timeouts_total', command=command.name)
+                continue
+            except Exception as e:
+                print(f"Error processing message: {str(e)}")
+                metrics.inc('handler_errors_total', command=command.name)
+                continue
+            try:
+                reply = self.bot.make_reply(command, response, message)
+                if reply:
+                    # Merging renders the reply, so a broken merge fails here
+                    self.outbox.put(reply)
+            except Exception as e:
+                print(f"Error building reply for {command.name}: {str(e)}")
+                metrics.inc('handler_errors_total', command=command.name)
+
+    async def _send(self):
+        while True:
+            reply = await self.outbox.get()
+            try:
+                text = reply.render()
+            except Exception as e:
+                print(f"Error rendering reply: {str(e)}")
+                continue
+            with metrics.timer('send'):
+                result = await asyncio.to_thread(self.bot.send_message, self.live_chat_id, text)
+            if not result:
+                continue
+            metrics.inc('replies_total')
+            if reply.origin:
+                metrics.observe('reply_latency_seconds', time.time() - reply.origin)
+            if self.on_sent:
+                self.on_sent(reply)
+
+    async def _maintain(self):
+        reported = None
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            self.seen.save()
+            stats = self.outbox.snapshot()
+            if stats != reported:
+                print(f"Outbox {self.live_chat_id}: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+                reported = stats
+
+
+class StreamSupervisor:
+    """Serve many live chats from one process and one authenticated client.
+
+    Every chat gets its own ``ChatEngine``, so polls follow each chat's own
+    ``pollingIntervalMillis``. All engines share the bot's client and one
+    worker thread pool, and the bot's pooled HTTP transport.
+    ``engine_options`` are passed to every ``ChatEngine``; give them a
+    ``bucket`` to share one send rate limit across all chats. With
+    ``leases``, a chat is only served while its lease is held, so
+    supervisors in other processes never poll it at the same time.
+    """
+
+    def __init__(self, bot, max_workers=32, reload_interval=10, leases=None, **engine_options):
+        self.bot = bot
+        self.leases = leases
+        self.engine_options = dict({'queue_size': 100}, **engine_options)
+        self.max_workers = max_workers
+        self.reload_interval = reload_interval
+        self.streams = {}
+        self.wanted = set()
+        self._streams_mtime = None
+
+    async def add_stream(self, video_id):
+        """Start serving a video's live chat"""
+        self.wanted.add(video_id)
+        if video_id in self.streams:
+            return True
+
+        live_chat_id = await asyncio.to_thread(self.bot.get_live_chat_id, video_id)
+        if not live_chat_id:
+            print(f"Could not get live chat ID for {video_id}!")
+            return False
+        if video_id in self.streams or video_id not in self.wanted:
+            return video_id in self.streams
+        if self.leases and not self.leases.acquire(live_chat_id):
+            print(f"Live chat for {video_id} is leased by another worker; will retry")
+            return False
+
+        try:
+            engine = ChatEngine(self.bot, live_chat_id, **self.engine_options)
+        except Exception:
+            if self.leases:
+                self.leases.release(live_chat_id)
+            raise
+        task = asyncio.create_task(engine.run())
+        task.add_done_callback(lambda done, video_id=video_id: self._stream_done(video_id, done))
+        self.streams[video_id] = (engine, task)
+        print(f"Connected to live chat for {video_id}")
+        return True
+
+    async def remove_stream(self, video_id):
+        """Stop serving a video's live chat"""
+        self.wanted.discard(video_id)
+        entry = self.streams.pop(video_id, None)
+        if entry:
+            engine, task = entry
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            self._release(engine)
+            print(f"Disconnected from live chat for {video_id}")
+
+    async def sync(self, video_ids):
+        """Add and drop streams so exactly ``video_ids`` are served"""
+        video_ids = set(video_ids)
+        for video_id in list(self.streams):
+            if video_id not in video_ids:
+                await self.remove_stream(video_id)
+        await asyncio.gather(*(self.add_stream(video_id) for video_id in video_ids))
+
+    def _release(self, engine):
+        if self.leases:
+            self.leases.release(engine.live_chat_id)
+
+    def _stream_done(self, video_id, task):
+        if task.cancelled():
+            return
+        entry = self.streams.get(video_id)
+        if entry and entry[1] is task:
+            del self.streams[video_id]
+            self._release(entry[0])
+        error = task.exception()
+        if error:
+            print(f"Stream {video_id} stopped: {str(error)}")
+        else:
+            self.wanted.discard(video_id)
+            self.bot.forget_live_chat(video_id)
+
+    def _read_streams_file(self, path):
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        if mtime == self._streams_mtime:
+            return None
+        self._streams_mtime = mtime
+        with open(path) as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+    async def run(self, video_ids, streams_file=None):
+        """Serve ``video_ids``, re-reading ``streams_file`` for changes if given"""
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(self.max_workers))
+        self.wanted = set(video_ids)
+        try:
+            while True:
+                if streams_file:
+                    video_ids = self._read_streams_file(streams_file)
+                    if video_ids is not None:
+                        self.wanted = set(video_ids)
+                # Also retries streams whose chat was not live yet
+                await self.sync(self.wanted)
+                await asyncio.sleep(self.reload_interval)
+        finally:
+            tasks = [task for engine, task in self.streams.values()]
+            self.streams.clear()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self.leases:
+                self.leases.release_all()
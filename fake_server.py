@@ -0,0 +1,210 @@
+"""Local stand-in for the YouTube Live Chat API, for load tests.
+
+Implements ``videos.list``, ``channels.list`` and ``liveChatMessages``
+``list``/``insert`` with configurable message rate, latency, error rate and
+``pollingIntervalMillis``. Every video ID is treated as a live stream
+whose chat receives ``rate`` generated messages per second.
+
+    python fake_server.py --port 8765 --rate 50
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import argparse
+import collections
+import datetime
+import json
+import random
+import threading
+import time
+
+AUTHORS = [f"viewer{i}" for i in range(500)]
+TEXTS = ["hello!", "hello everyone", "lol", "nice stream", "help", "!time", "!about",
+         "gg", "what song is this", "so helpful thanks", "first", "pog"]
+TRIGGERS = {"hello!", "hello everyone", "help", "!time", "!about"}
+
+
+def _timestamp(when):
+    return datetime.datetime.fromtimestamp(when, datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+class FakeChat:
+    """Messages of one fake live chat, generated lazily at ``rate`` per second"""
+
+    def __init__(self, live_chat_id, rate, seed=0):
+        self.live_chat_id = live_chat_id
+        self.rate = rate
+        self.started = time.time()
+        self.messages = []
+        self.random = random.Random(seed)
+
+    def _generate(self, now):
+        due = int((now - self.started) * self.rate)
+        for index in range(len(self.messages), due):
+            author = self.random.choice(AUTHORS)
+            self.messages.append({
+                'id': f"{self.live_chat_id}.{index}",
+                'snippet': {
+                    'type': 'textMessageEvent',
+                    'liveChatId': self.live_chat_id,
+                    'publishedAt': _timestamp(self.started + index / self.rate),
+                    'displayMessage': self.random.choice(TEXTS),
+                },
+                'authorDetails': {'displayName': author, 'channelId': f"UC{author}"},
+            })
+
+    def page(self, page_token, max_results=500):
+        self._generate(time.time())
+        start = int(page_token) if page_token else len(self.messages)
+        items = self.messages[start:start + max_results]
+        return items, str(start + len(items))
+
+
+class FakeYouTube:
+    """State and counters shared by the fake server's request handlers"""
+
+    def __init__(self, rate=10, latency=0.05, jitter=0.02, error_rate=0.0,
+                 polling_interval=2000):
+        self.rate = rate
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.polling_interval = polling_interval
+        self.chats = {}
+        self.calls = collections.Counter()
+        self.delivered = 0
+        self.triggers = 0
+        self.inserted = []
+        self.lock = threading.Lock()
+
+    def chat(self, live_chat_id):
+        with self.lock:
+            if live_chat_id not in self.chats:
+                self.chats[live_chat_id] = FakeChat(live_chat_id, self.rate, seed=len(self.chats))
+            return self.chats[live_chat_id]
+
+    def list_messages(self, query):
+        chat = self.chat(query['liveChatId'])
+        with self.lock:
+            items, next_token = chat.page(query.get('pageToken'), int(query.get('maxResults', 500)))
+            self.delivered += len(items)
+            self.triggers += sum(1 for item in items if item['snippet']['displayMessage'] in TRIGGERS)
+        return {
+            'kind': 'youtube#liveChatMessageListResponse',
+            'nextPageToken': next_token,
+            'pollingIntervalMillis': self.polling_interval,
+            'items': items,
+        }
+
+    def insert_message(self, body):
+        snippet = body['snippet']
+        with self.lock:
+            self.inserted.append((time.time(), snippet['liveChatId'],
+                                  snippet['textMessageDetails']['messageText']))
+            message_id = f"insert.{len(self.inserted)}"
+        return {'id': message_id, 'snippet': snippet}
+
+    def stats(self):
+        with self.lock:
+            return {'calls': dict(self.calls), 'delivered': self.delivered,
+                    'triggers': self.triggers, 'inserted': len(self.inserted)}
+
+
+class FakeYouTubeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, reason, message):
+        self._reply(status, {'error': {'code': status, 'message': message,
+                                       'errors': [{'reason': reason, 'message': message}]}})
+
+    def _handle(self, method):
+        fake = self.server.fake
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+
+        if url.path.endswith('/videos'):
+            endpoint = 'videos.list'
+        elif url.path.endswith('/channels'):
+            endpoint = 'channels.list'
+        elif url.path.endswith('/liveChat/messages'):
+            endpoint = 'liveChatMessages.insert' if method == 'POST' else 'liveChatMessages.list'
+        else:
+            return self._error(404, 'notFound', f"Unknown path {url.path}")
+
+        with fake.lock:
+            fake.calls[endpoint] += 1
+        time.sleep(max(0, fake.latency + random.uniform(-fake.jitter, fake.jitter)))
+        if random.random() < fake.error_rate:
+            return self._error(503, 'backendError', "Injected failure")
+
+        if endpoint == 'videos.list':
+            video_ids = query.get('id', '').split(',')
+            self._reply(200, {'items': [
+                {'id': video_id, 'liveStreamingDetails': {'activeLiveChatId': f"chat-{video_id}"}}
+                for video_id in video_ids if video_id
+            ]})
+        elif endpoint == 'channels.list':
+            self._reply(200, {'items': [{'id': 'UCfakebot'}]})
+        elif endpoint == 'liveChatMessages.list':
+            self._reply(200, fake.list_messages(query))
+        else:
+            self._reply(200, fake.insert_message(body))
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class FakeYouTubeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, fake, host='127.0.0.1', port=0):
+        super().__init__((host, port), FakeYouTubeHandler)
+        self.fake = fake
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        """Serve from a background thread"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rate', type=float, default=10, help="messages per second per chat")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per request")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--interval', type=int, default=2000, help="pollingIntervalMillis")
+    args = parser.parse_args()
+
+    fake = FakeYouTube(args.rate, args.latency, error_rate=args.error_rate,
+                       polling_interval=args.interval)
+    server = FakeYouTubeServer(fake, port=args.port)
+    print(f"Fake YouTube API listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(fake.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+
+
+class HandlerPool:
+    """Run command handlers without blocking the event loop.
+
+    A command's ``kind`` picks where its handler runs: ``inline`` handlers
+    are cheap and run on the spot, ``io`` handlers run in a thread pool, and
+    ``cpu`` handlers run in a process pool. ``cpu`` handlers must be
+    module-level functions so they can be pickled. The pools start on first
+    use and can be shared by many engines.
+    """
+
+    def __init__(self, max_threads=8, max_processes=None):
+        self.max_threads = max_threads
+        self.max_processes = max_processes
+        self._threads = None
+        self._processes = None
+
+    def _executor(self, kind):
+        if kind == 'io':
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(self.max_threads, thread_name_prefix='handler')
+            return self._threads
+        if kind == 'cpu':
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(self.max_processes)
+            return self._processes
+        raise ValueError(f"Unknown handler kind: {kind}")
+
+    def submit(self, command, author, text):
+        """Start a command's handler; return an asyncio future for its reply text"""
+        loop = asyncio.get_running_loop()
+        if command.kind == 'inline':
+            future = loop.create_future()
+            try:
+                future.set_result(command.handler(author, text))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return loop.run_in_executor(self._executor(command.kind), command.handler, author, text)
+
+    async def result(self, future, timeout):
+        """Wait up to ``timeout`` seconds for a handler, cancelling it on timeout.
+
+        A handler already running in a worker cannot be interrupted. Its
+        result is discarded, and a queued one never starts.
+        """
+        return await asyncio.wait_for(future, max(0, timeout))
+
+    def shutdown(self):
+        for executor in (self._threads, self._processes):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._threads = None
+        self._processes = None
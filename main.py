@@ -1,80 +1,120 @@
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.oauth2.credentials import Credentials
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-import pickle
+from engine import ChatEngine, StreamSupervisor
+from commands import CommandWatcher, default_registry, load_registry
+from outbox import Reply
+from cache import LookupCache
+from credstore import CredentialStore, TokenRefresher
+from client import build_youtube
+from transport import RequestsTransport
+from metrics import metrics, serve_metrics
+from handlers import HandlerPool
+from messages import CHAT_FIELDS, ChatMessage
+from replay import replay, report
+from shard import ShardCoordinator
+from quota import DEFAULT_DAILY_LIMIT, QuotaPlanner
+import argparse
+import asyncio
 import os
-import time
-import json
+import sys
+import tempfile
 
+# Google client libraries are imported where they are first used, so the
+# bot starts quickly and modules that only need the pipeline stay light.
 
 # Get the JSON string from the environment variable
 client_secrets_content = os.getenv("CLIENT_SECRETS_JSON")
 SERVICE_ACCOUNT_CONTENT = os.getenv("SERVICE_ACCOUNT")
 VIDEO_ID = os.getenv("VIDEO_ID")
-# Write the content to a client_secrets.json file if the environment variable is set
-if client_secrets_content:
-    with open("client_secrets.json", "w") as f:
-        f.write(client_secrets_content)
-else:
-    raise ValueError("CLIENT_SECRETS_JSON environment variable is not set.")
-
-if SERVICE_ACCOUNT_CONTENT:
-    with open("service_account_creds.json", "w") as f:
-        f.write(SERVICE_ACCOUNT_CONTENT)
-else:
-    raise ValueError("SERVICE_ACCOUNT environment variable is not set.")
+STREAMS_FILE = os.getenv("STREAMS_FILE")
+STATE_DIR = os.getenv("STATE_DIR", ".youbot")
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+METRICS_PORT = os.getenv("METRICS_PORT")
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR")
+COMMANDS_FILE = os.getenv("COMMANDS_FILE")
+QUOTA_LIMIT = int(os.getenv("QUOTA_LIMIT", str(DEFAULT_DAILY_LIMIT)))
+
+# Per-call HTTP timeouts, in seconds
+POLL_TIMEOUT = 20
+SEND_TIMEOUT = 10
+LOOKUP_TIMEOUT = 30
+
+# How long cached lookups stay valid, in seconds
+LIVE_CHAT_ID_TTL = 6 * 3600
+CHANNEL_TTL = 24 * 3600
+
+
+def _write_atomic(path, content):
+    """Replace ``path`` in one step, so concurrent readers never see a partial file"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.' + os.path.basename(path) + '-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def write_secret_files():
+    """Write the secrets from the environment to the files the auth code reads"""
+    # Sharded workers all write these at startup, so each file is replaced
+    # atomically rather than truncated and rewritten in place
+    if client_secrets_content:
+        _write_atomic("client_secrets.json", client_secrets_content)
+    else:
+        raise ValueError("CLIENT_SECRETS_JSON environment variable is not set.")
+
+    if SERVICE_ACCOUNT_CONTENT:
+        _write_atomic("service_account_creds.json", SERVICE_ACCOUNT_CONTENT)
+    else:
+        raise ValueError("SERVICE_ACCOUNT environment variable is not set.")
 
 
 class YouTubeAPIBot:
-    def __init__(self):
+    def __init__(self, transport=None, api_endpoint=None, state_dir=STATE_DIR):
         self.credentials = None
         self.youtube = None
-        self.token_path = 'token.pickle'
+        self.transport = transport
+        self.api_endpoint = api_endpoint
+        self.state_dir = state_dir
+        self.token_path = os.path.join(state_dir, 'token.json')
+        self.token_refresher = None
+        # Commands come from COMMANDS_FILE if set, reloaded when it changes
+        self.commands = load_registry(COMMANDS_FILE) if COMMANDS_FILE else default_registry()
+        self.command_watcher = None
+        self.cache = LookupCache(os.path.join(state_dir, 'cache.json'))
+        self.handlers = HandlerPool()
+        # Every API call is charged here; engines pace themselves by it
+        self.quota = QuotaPlanner(QUOTA_LIMIT, store=LookupCache(os.path.join(state_dir, 'quota.json')))
         
         # Using minimal required scopes
         self.SCOPES = [
             'https://www.googleapis.com/auth/youtube',  # Manage your YouTube account
             'https://www.googleapis.com/auth/youtube.readonly'  # View account info
         ]
+        self.credential_store = CredentialStore(
+            self.token_path, self.SCOPES, service_account_file='service_account_creds.json'
+        )
         
     def authenticate(self):
         """Authenticate using service account credentials for automation."""
-        creds = None
-
-        # Check if the credentials already exist (from service account or pre-generated token)
-        if os.path.exists(self.token_path):
-            with open(self.token_path, 'rb') as token:
-                creds = pickle.load(token)
-
-        if not creds or not creds.valid:
-            # Use Service Account credentials for authentication
-            try:
-                # Set the path to your service account JSON key file
-                # service_account_file = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")  # You can set this as an environment variable
-                # if not service_account_file:
-                #     raise ValueError("The GOOGLE_APPLICATION_CREDENTIALS environment variable is not set.")
-                
-                # Load service account credentials
-                creds = service_account.Credentials.from_service_account_file(
-                    service_account_creds.json, scopes=self.SCOPES
-                )
-                print("Authenticated using service account credentials.")
-            except Exception as e:
-                print(f"Error during service account authentication: {e}")
-                return False
-
-            # Save credentials for future use
-            with open(self.token_path, 'wb') as token:
-                pickle.dump(creds, token)
+        try:
+            write_secret_files()
+            creds = self.credential_store.load()
+            if not creds.valid:
+                self.credential_store.refresh(creds)
+            print("Authenticated using service account credentials.")
+        except Exception as e:
+            print(f"Error during service account authentication: {e}")
+            return False
+
+        # Keep the token fresh so an expiry never stalls the chat loop
+        if self.token_refresher:
+            self.token_refresher.stop()
+        self.token_refresher = TokenRefresher(self.credential_store, creds)
+        self.token_refresher.start()
 
         self.credentials = creds
-        self.youtube = build('youtube', 'v3', credentials=creds)
+        if self.transport is None:
+            self.transport = RequestsTransport(creds, pool_size=HTTP_POOL_SIZE)
+        self.build_client()
         return True
 
-
         # """Handle the OAuth2 flow with minimal scopes"""
         # creds = None
         
@@ -126,32 +166,64 @@ class YouTubeAPIBot:
         # self.youtube = build('youtube', 'v3', credentials=creds)
         # return True
 
+    def build_client(self):
+        """Build the API client over the bot's transport"""
+        self.youtube = build_youtube(self.transport, self.state_dir, self.api_endpoint)
+
+    def _execute(self, request, timeout):
+        """Execute an API request over the shared transport"""
+        method = getattr(request, 'methodId', '').replace('youtube.', '', 1)
+        metrics.api_call(method)
+        if self.quota is not None:
+            self.quota.charge(method)
+        try:
+            with metrics.timer('api', method=method):
+                return request.execute(http=self.transport.with_timeout(timeout))
+        except Exception:
+            metrics.inc('api_errors_total', method=method)
+            raise
+
     def get_live_chat_id(self, video_id):
         """Get live chat ID using minimal permissions"""
+        cached = self.cache.get(f"chat:{video_id}")
+        if cached:
+            return cached
+
         try:
             request = self.youtube.videos().list(
                 part="liveStreamingDetails",
                 id=video_id
             )
-            response = request.execute()
+            response = self._execute(request, LOOKUP_TIMEOUT)
 
             if not response['items']:
                 raise Exception("Video not found or not a livestream")
 
-            return response['items'][0]['liveStreamingDetails']['activeLiveChatId']
+            live_chat_id = response['items'][0]['liveStreamingDetails']['activeLiveChatId']
+            self.cache.set(f"chat:{video_id}", live_chat_id, LIVE_CHAT_ID_TTL)
+            return live_chat_id
         except Exception as e:
             print(f"Error getting live chat ID: {str(e)}")
             return None
 
+    def forget_live_chat(self, video_id):
+        """Drop the cached chat ID of a video whose chat has ended"""
+        self.cache.delete(f"chat:{video_id}")
+
+    def fetch_chat_messages(self, live_chat_id, page_token=None):
+        """Get chat messages, raising on API errors"""
+        request = self.youtube.liveChatMessages().list(
+            liveChatId=live_chat_id,
+            part="snippet,authorDetails",
+            pageToken=page_token,
+            fields=CHAT_FIELDS
+        )
+        return self._execute(request, POLL_TIMEOUT)
+
     def get_chat_messages(self, live_chat_id, page_token=None):
         """Get chat messages with minimal scope"""
         try:
-            request = self.youtube.liveChatMessages().list(
-                liveChatId=live_chat_id,
-                part="snippet,authorDetails",
-                pageToken=page_token
-            )
-            return request.execute()
+            return self.fetch_chat_messages(live_chat_id, page_token)
         except Exception as e:
             print(f"Error getting chat messages: {str(e)}")
             return None
@@ -171,45 +243,69 @@ class YouTubeAPIBot:
                     }
                 }
             )
-            return request.execute()
+            return self._execute(request, SEND_TIMEOUT)
         except Exception as e:
             print(f"Error sending message: {str(e)}")
             return None
 
-    def process_message(self, message):
-        """Process messages with basic responses"""
-        try:
-            author = message['authorDetails']['displayName']
-            message_text = message['snippet']['displayMessage'].lower()
-            message_type = message['snippet']['type']
+    def match_command(self, message):
+        """Return the command a ChatMessage triggers, or None"""
+        if message.type != 'textMessageEvent':
+            return None
+        return self.commands.match(message.text)
 
-            if message_type != 'textMessageEvent':
+    def make_reply(self, command, response, message):
+        """Wrap a handler's response as the outbound Reply, or None if it is empty"""
+        if not response:
+            return None
+        return Reply(
+            response,
+            priority=command.priority,
+            key=('merge', command.name) if command.merge else None,
+            arg=message.author,
+            merge=command.merge,
+            origin=message.timestamp()
+        )
+
+    def build_reply(self, message):
+        """Build the outbound Reply for a ChatMessage or raw API item, or None"""
+        try:
+            if isinstance(message, dict):
+                message = ChatMessage.from_item(message)
+            command = self.match_command(message)
+            if command is None:
                 return None
 
-            if 'hello' in message_text:
-                return f"Hello {author}! 👋"
-            elif 'help' in message_text:
-                return "Available commands: !help, !about, !time"
-            elif '!about' in message_text:
-                return "I'm a YouTube chatbot using minimal permissions!"
-            elif '!time' in message_text:
-                return f"Current time: {time.strftime('%H:%M:%S')}"
-
-            return None
+            return self.make_reply(command, command.handler(message.author, message.text), message)
 
         except Exception as e:
             print(f"Error processing message: {str(e)}")
             return None
 
+    def process_message(self, message):
+        """Process messages with basic responses"""
+        reply = self.build_reply(message)
+        return reply.text if reply else None
+
     def verify_permissions(self):
         """Verify minimal required permissions"""
+        identity = (getattr(self.credentials, 'service_account_email', None)
+                    or getattr(self.credentials, 'client_id', None))
+        cache_key = f"channel:{identity}"
+        if identity and self.cache.get(cache_key) is not None:
+            print("✓ Minimal API access verified (cached)")
+            return True
+
         try:
             # Test basic access
-            test_response = self.youtube.channels().list(
+            test_response = self._execute(self.youtube.channels().list(
                 part="id",
                 mine=True
-            ).execute()
+            ), LOOKUP_TIMEOUT)
             
+            channel_ids = [item['id'] for item in test_response.get('items', [])]
+            if identity:
+                self.cache.set(cache_key, channel_ids, CHANNEL_TTL)
             print("✓ Successfully verified minimal API access")
             return True
             
@@ -222,16 +318,26 @@ class YouTubeAPIBot:
                 print(f"   - {scope}")
             return False
 
-    def run(self, video_id):
-        """Main bot loop"""
-        print("Starting YouTube chatbot (minimal permissions)...")
-        
+    def connect(self):
+        """Authenticate and verify access once, for any number of streams"""
         if not self.authenticate():
             print("Authentication failed!")
-            return
+            return False
             
         if not self.verify_permissions():
             print("Permission verification failed!")
+            return False
+        metrics.add_collector(self.quota.collect)
+        if COMMANDS_FILE and self.command_watcher is None:
+            self.command_watcher = CommandWatcher(self, COMMANDS_FILE)
+            self.command_watcher.start()
+        return True
+
+    def run(self, video_id):
+        """Main bot loop"""
+        print("Starting YouTube chatbot (minimal permissions)...")
+        
+        if not self.connect():
             return
 
         live_chat_id = self.get_live_chat_id(video_id)
@@ -242,35 +348,71 @@ class YouTubeAPIBot:
         print(f"Successfully connected to live chat!")
         print(f"Bot is now running! Press Ctrl+C to stop.")
 
-        next_page_token = None
-        while True:
-            try:
-                chat_data = self.get_chat_messages(live_chat_id, next_page_token)
-                if not chat_data:
-                    continue
+        try:
+            engine = ChatEngine(self, live_chat_id, cache=self.cache, state_dir=self.state_dir,
+                                handlers=self.handlers, archive_dir=ARCHIVE_DIR, quota=self.quota)
+            asyncio.run(engine.run())
+            self.forget_live_chat(video_id)
+        except KeyboardInterrupt:
+            print("\nBot stopped by user")
+        finally:
+            self.cache.flush()
+            self.quota.flush()
+            self.handlers.shutdown()
+
+    def run_many(self, video_ids, streams_file=None, leases=None):
+        """Supervisor loop serving several live chats with one client"""
+        print("Starting YouTube chatbot supervisor (minimal permissions)...")
+
+        if not self.connect():
+            return
 
-                next_page_token = chat_data['nextPageToken']
+        print("Bot is now running! Press Ctrl+C to stop.")
 
-                for message in chat_data['items']:
-                    response = self.process_message(message)
-                    if response:
-                        self.send_message(live_chat_id, response)
+        try:
+            supervisor = StreamSupervisor(self, cache=self.cache, state_dir=self.state_dir,
+                                          handlers=self.handlers, archive_dir=ARCHIVE_DIR,
+                                          quota=self.quota, leases=leases)
+            asyncio.run(supervisor.run(video_ids, streams_file))
+        except KeyboardInterrupt:
+            print("\nBot stopped by user")
+        finally:
+            self.cache.flush()
+            self.quota.flush()
+            self.handlers.shutdown()
 
-                time_to_sleep = chat_data['pollingIntervalMillis'] / 1000
-                time.sleep(time_to_sleep)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="YouTube live chat bot")
+    parser.add_argument("video_ids", nargs="*",
+                        help="videos to serve (default: the comma-separated VIDEO_ID variable)")
+    parser.add_argument("--replay", metavar="LOG",
+                        help="replay a recorded chat log (JSON lines) offline and report decisions")
+    parser.add_argument("--show", action="store_true",
+                        help="with --replay, print every reply")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="serve the streams from this many worker processes")
+    args = parser.parse_args()
 
-            except KeyboardInterrupt:
-                print("\nBot stopped by user")
-                break
-            except Exception as e:
-                print(f"An error occurred: {str(e)}")
-                time.sleep(5)
+    bot = YouTubeAPIBot()
+    if args.replay:
+        report(replay(bot, args.replay, show=args.show))
+        sys.exit()
 
-if __name__ == "__main__":
     print("YouTube Chat Bot - Minimal Permissions Setup")
     print("Starting bot with minimal permissions...")
+
+    if METRICS_PORT:
+        serve_metrics(int(METRICS_PORT))
     
-    VIDEO_ID = f"{VIDEO_ID}"
+    # Video IDs come from the command line or a comma-separated VIDEO_ID
+    video_ids = args.video_ids or [v.strip() for v in f"{VIDEO_ID}".split(",") if v.strip()]
     
-    bot = YouTubeAPIBot()
-    bot.run(VIDEO_ID)
\ No newline at end of file
+    if args.workers > 1:
+        try:
+            ShardCoordinator(video_ids, args.workers, STATE_DIR, STREAMS_FILE).run()
+        except KeyboardInterrupt:
+            print("\nBot stopped by user")
+    elif len(video_ids) == 1 and not STREAMS_FILE:
+        bot.run(video_ids[0])
+    else:
+        bot.run_many(video_ids, STREAMS_FILE)
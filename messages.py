@@ -0,0 +1,56 @@
+import datetime
+import sys
+
+# Only the parts of a liveChatMessages.list response the bot reads, so the
+# API sends and the client decodes less JSON per poll
+CHAT_FIELDS = ("nextPageToken,pollingIntervalMillis,offlineAt,"
+               "items(id,snippet(type,displayMessage,publishedAt),"
+               "authorDetails(displayName,channelId))")
+
+
+class ChatMessage:
+    """The fields the bot uses from one ``liveChatMessages`` item"""
+
+    __slots__ = ('id', 'type', 'text', 'author', 'channel_id', 'published_at')
+
+    def __init__(self, id, type, text, author, channel_id, published_at=None):
+        self.id = id
+        self.type = type
+        self.text = text
+        self.author = author
+        self.channel_id = channel_id
+        self.published_at = published_at
+
+    @classmethod
+    def from_item(cls, item, intern=sys.intern):
+        """Build a message from an API item, interning repeated strings"""
+        snippet = item['snippet']
+        details = item['authorDetails']
+        return cls(
+            item.get('id'),
+            intern(snippet['type']),
+            snippet.get('displayMessage', ''),
+            intern(details['displayName']),
+            intern(details.get('channelId', '')),
+            snippet.get('publishedAt'),
+        )
+
+    def timestamp(self):
+        """Epoch seconds the message was published, or None"""
+        if not self.published_at:
+            return None
+        return datetime.datetime.fromisoformat(self.published_at.replace('Z', '+00:00')).timestamp()
+
+    def __repr__(self):
+        return f"ChatMessage({self.id!r}, {self.author!r}, {self.text!r})"
+
+
+def parse_items(items):
+    """Turn the ``items`` of a chat page into ChatMessages, skipping malformed ones"""
+    messages = []
+    for item in items:
+        try:
+            messages.append(ChatMessage.from_item(item))
+        except (KeyError, TypeError) as e:
+            print(f"Skipping malformed chat message: {str(e)}")
+    return messages
@@ -0,0 +1,175 @@
+"""Hot-path counters, latency histograms and a local metrics endpoint.
+
+``metrics`` is the process-wide registry. ``serve_metrics(port)`` exposes
+it in the Prometheus text format on ``/metrics``. ``/profile?seconds=N``
+samples every thread's stack and returns collapsed stacks, the input
+format of flamegraph tools.
+"""
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import bisect
+import collections
+import sys
+import threading
+import time
+
+# YouTube Data API quota units charged per call
+QUOTA_COSTS = {
+    'videos.list': 1,
+    'channels.list': 1,
+    'liveChatMessages.list': 5,
+    'liveChatMessages.insert': 50,
+}
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format(name, labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return name
+    return name + '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+class Metrics:
+    """Thread-safe counters, gauges and histograms keyed by name and labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = collections.Counter()
+        self.histograms = {}
+        self._collectors = []
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self.counters[name, _labels(labels)] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        """Record how long the block takes in ``stage_seconds``"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - started, stage=stage, **labels)
+
+    def api_call(self, method):
+        """Count an API call and the quota it costs"""
+        with self._lock:
+            self.counters['api_calls_total', (('method', method),)] += 1
+            self.counters['quota_units_total', ()] += QUOTA_COSTS.get(method, 1)
+
+    def add_collector(self, collect):
+        """Register ``collect()`` returning ``(name, labels, value)`` gauges"""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def remove_collector(self, collect):
+        with self._lock:
+            if collect in self._collectors:
+                self._collectors.remove(collect)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            histograms = [(key, list(h.counts), h.sum, h.count, h.buckets) for key, h in histograms]
+            collectors = list(self._collectors)
+
+        for (name, labels), value in counters:
+            lines.append(f"{_format(name, labels)} {value}")
+        for (name, labels), counts, total, count, buckets in histograms:
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f"{_format(name + '_bucket', labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{_format(name + '_sum', labels)} {total}")
+            lines.append(f"{_format(name + '_count', labels)} {count}")
+        for collect in collectors:
+            for name, labels, value in collect():
+                lines.append(f"{_format(name, _labels(labels))} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def sample_stacks(seconds, interval=0.01):
+    """Sample all threads' stacks; return collapsed ``frame;frame count`` lines"""
+    stacks = collections.Counter()
+    me = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            stacks[';'.join(reversed(names))] += 1
+        time.sleep(interval)
+    return '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common()) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/metrics':
+            body = self.server.metrics.render()
+        elif url.path == '/profile':
+            seconds = float(parse_qs(url.query).get('seconds', ['5'])[0])
+            body = sample_stacks(min(seconds, 60))
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve_metrics(port, host='127.0.0.1', registry=metrics):
+    """Serve ``/metrics`` and ``/profile`` from a background thread"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.metrics = registry
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    print(f"Metrics available at http://{host}:{server.server_address[1]}/metrics")
+    return server
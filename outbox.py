@@ -0,0 +1,186 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+# YouTube rejects chat messages longer than this
+MAX_MESSAGE_LENGTH = 200
+
+
+class TokenBucket:
+    """Token-bucket rate limiter: ``rate`` sends per second, bursts up to ``capacity``"""
+
+    def __init__(self, rate=1.0, capacity=5):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Take a token; return 0 on success or the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    async def acquire(self):
+        while True:
+            wait = self.take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class Reply:
+    """An outbound chat message, optionally mergeable with others of the same key.
+
+    ``merge(args)`` renders one message for several replies, e.g. the
+    authors of a burst of hellos. ``origin`` is the epoch time the message
+    being answered was published, used to measure reply latency. Without
+    a ``key`` a reply is keyed by ``('text', text)``, so callers namespace
+    their own keys, e.g. ``('merge', name)``, to keep them apart.
+    """
+
+    __slots__ = ('text', 'priority', 'key', 'args', 'merge', 'created', 'origin')
+
+    def __init__(self, text, priority=10, key=None, arg=None, merge=None, origin=None):
+        self.text = text
+        self.priority = priority
+        self.key = key if key is not None else ('text', text)
+        self.args = [arg] if arg is not None else []
+        self.merge = merge
+        self.created = time.monotonic()
+        self.origin = origin
+
+    def render(self):
+        if self.merge and len(self.args) > 1:
+            return self.merge(self.args)
+        return self.text
+
+    def absorb(self, other, max_args):
+        """Fold ``other`` into this reply if the result still fits in one message"""
+        if not self.merge:
+            return True
+        new_args = [arg for arg in other.args if arg not in self.args]
+        if not new_args:
+            return True
+        args = self.args + new_args
+        if len(args) > max_args or len(self.merge(args)) > MAX_MESSAGE_LENGTH:
+            return False
+        self.args = args
+        return True
+
+
+class Outbox:
+    """Priority queue of outbound replies that collapses duplicates.
+
+    Identical replies, and mergeable replies with the same key, that are
+    still waiting to be sent become one message. Mergeable replies wait
+    ``window`` seconds so a burst can collapse. Lower priority numbers go
+    first, sends are paced by a ``TokenBucket``, and replies older than
+    ``max_age`` or beyond ``maxsize`` are dropped. A ``gate(priority)``
+    returning False holds replies back, e.g. to save API quota. Ages are
+    measured by ``clock``, which a replay can drive from message times.
+    """
+
+    def __init__(self, bucket=None, maxsize=100, window=1.0, max_age=30, max_merge=10, gate=None,
+                 clock=time.monotonic):
+        self.bucket = bucket or TokenBucket()
+        self.gate = gate
+        self.clock = clock
+        self.maxsize = maxsize
+        self.window = window
+        self.max_age = max_age
+        self.max_merge = max_merge
+        self.stats = {'queued': 0, 'merged': 0, 'sent': 0, 'dropped': 0}
+        self._heap = []
+        self._pending = {}
+        self._counter = itertools.count()
+        self._ready = asyncio.Event()
+
+    @property
+    def depth(self):
+        return len(self._heap)
+
+    def snapshot(self):
+        return dict(self.stats, depth=self.depth)
+
+    def put(self, reply):
+        """Queue a reply; return False if it was dropped"""
+        pending = self._pending.get(reply.key)
+        if pending is not None and pending.absorb(reply, self.max_merge):
+            self.stats['merged'] += 1
+            return True
+
+        if len(self._heap) >= self.maxsize:
+            worst = max(self._heap)
+            if reply.priority >= worst[0]:
+                self.stats['dropped'] += 1
+                return False
+            self._heap.remove(worst)
+            heapq.heapify(self._heap)
+            self._forget(worst[2])
+            self.stats['dropped'] += 1
+
+        reply.created = self.clock()
+        heapq.heappush(self._heap, (reply.priority, next(self._counter), reply))
+        self._pending[reply.key] = reply
+        self.stats['queued'] += 1
+        self._ready.set()
+        return True
+
+    def _forget(self, reply):
+        if self._pending.get(reply.key) is reply:
+            del self._pending[reply.key]
+
+    def pop(self):
+        """Take the next reply if it is due, without waiting.
+
+        Returns ``(reply, 0)``, or ``(None, wait)`` where ``wait`` is the
+        seconds until the head of the queue may be due, or None if the
+        outbox is empty.
+        """
+        while self._heap:
+            reply = self._heap[0][2]
+            age = self.clock() - reply.created
+            if age > self.max_age:
+                heapq.heappop(self._heap)
+                self._forget(reply)
+                self.stats['dropped'] += 1
+                continue
+            if reply.merge and age < self.window:
+                return None, self.window - age
+            if self.gate and not self.gate(reply.priority):
+                # Everything queued ranks at or below the head, so wait for
+                # a more urgent reply or check again shortly
+                return None, 1
+            wait = self.bucket.take()
+            if wait:
+                return None, wait
+            heapq.heappop(self._heap)
+            self._forget(reply)
+            self.stats['sent'] += 1
+            return reply, 0
+        return None, None
+
+    async def get(self):
+        """Wait for the next reply that is due and allowed by the rate limit"""
+        while True:
+            reply, wait = self.pop()
+            if reply is not None:
+                return reply
+            # A new reply may be more urgent than the one being waited for
+            self._ready.clear()
+            if wait is None:
+                await self._ready.wait()
+                continue
+            try:
+                await asyncio.wait_for(self._ready.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
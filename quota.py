@@ -0,0 +1,177 @@
+import collections
+import datetime
+import threading
+import time
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+    QUOTA_TZ = ZoneInfo('America/Los_Angeles')
+except (ImportError, ZoneInfoNotFoundError):
+    QUOTA_TZ = datetime.timezone(datetime.timedelta(hours=-8))
+
+from metrics import QUOTA_COSTS
+
+# YouTube Data API projects get this many units a day unless raised
+DEFAULT_DAILY_LIMIT = 10000
+
+
+class LocalQuota:
+    """Quota units spent today by this process.
+
+    ``roll(day)`` starts a new quota day, and ``raise_to(units)`` seeds the
+    count from units recorded before a restart. ``shard.SharedQuota``
+    offers the same methods over shared memory.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.day = None
+        self.used = 0
+
+    def charge(self, method):
+        with self._lock:
+            self.used += QUOTA_COSTS.get(method, 1)
+
+    def roll(self, day):
+        with self._lock:
+            if self.day != day:
+                self.day = day
+                self.used = 0
+
+    def raise_to(self, units):
+        with self._lock:
+            self.used = max(self.used, units)
+
+
+def quota_day(now=None):
+    """The current quota day, as the ordinal of the date in Pacific time"""
+    return datetime.datetime.fromtimestamp(now if now is not None else time.time(), QUOTA_TZ).toordinal()
+
+
+def seconds_until_reset(now=None):
+    """Seconds until the daily quota resets at midnight Pacific time"""
+    now = datetime.datetime.fromtimestamp(now if now is not None else time.time(), QUOTA_TZ)
+    midnight = (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds()
+
+
+class QuotaPlanner:
+    """Spread the daily API quota so the bot lasts until the quota resets.
+
+    Every API call is charged its unit cost to ``counter``. A
+    ``SharedQuota`` lets several worker processes plan against one budget.
+    The burn rate over the last ``window`` seconds is compared with what
+    is left, less a ``reserve`` fraction held back for important replies,
+    spread over the time until midnight Pacific. When the bot burns
+    faster than that, ``pressure`` rises above 1. Polls are then stretched by the same factor, and replies
+    with a priority number above ``defer_priority`` wait in the outbox
+    until the pressure drops; the outbox expires them if it does not.
+    With a ``store`` (a ``LookupCache``), units used today are saved until
+    the reset and seed the count after a restart, so restarts do not
+    hand the bot a fresh budget.
+    """
+
+    def __init__(self, daily_limit=DEFAULT_DAILY_LIMIT, counter=None, reserve=0.1,
+                 defer_priority=10, window=600, max_interval=120, store=None):
+        self.daily_limit = daily_limit
+        self.counter = counter if counter is not None else LocalQuota()
+        self.reserve = reserve
+        self.defer_priority = defer_priority
+        self.window = window
+        self.max_interval = max_interval
+        self.store = store
+        self._lock = threading.Lock()
+        self._day_end = 0
+        self._roll()
+        if store is not None:
+            # A shared counter may already hold more than the saved count
+            self.counter.raise_to(store.get(self._store_key) or 0)
+        self._samples = collections.deque([(time.monotonic(), self.counter.used)])
+        self._stretching = False
+
+    def charge(self, method):
+        """Charge one call to ``method`` against the budget"""
+        self.counter.charge(method)
+        if self.store is not None:
+            # The cache batches these into a write every few seconds
+            self.store.set(self._store_key, self.used_today, max(self._day_end - time.time(), 0) + 3600)
+
+    def flush(self):
+        if self.store is not None:
+            self.store.flush()
+
+    def _roll(self):
+        now = time.time()
+        if now >= self._day_end:
+            day = quota_day(now)
+            self._day_end = now + seconds_until_reset(now)
+            self._store_key = f"quota:{day}"
+            self.counter.roll(day)
+
+    @property
+    def used_today(self):
+        with self._lock:
+            self._roll()
+            return self.counter.used
+
+    def remaining(self):
+        """Units left today before the reserve"""
+        return self.daily_limit * (1 - self.reserve) - self.used_today
+
+    def burn_rate(self):
+        """Units spent per second over the last ``window`` seconds"""
+        now = time.monotonic()
+        used = self.counter.used
+        with self._lock:
+            samples = self._samples
+            if now - samples[-1][0] >= 10:
+                samples.append((now, used))
+            while len(samples) > 2 and now - samples[1][0] >= self.window:
+                samples.popleft()
+            started, used_then = samples[0]
+        # Damp the estimate until a minute of history exists; the count
+        # drops at the daily reset, which is not negative spending
+        return max(used - used_then, 0) / max(now - started, 60)
+
+    def projected_exhaustion(self):
+        """Seconds until the quota runs out at the current rate, or None if it will not"""
+        rate = self.burn_rate()
+        left = self.daily_limit - self.used_today
+        if left <= 0:
+            return 0
+        return left / rate if rate else None
+
+    def pressure(self):
+        """Burn rate relative to what the rest of the day allows; above 1 means over budget"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            return float('inf')
+        return self.burn_rate() / (remaining / max(self._day_end - time.time(), 1))
+
+    def stretch(self, delay):
+        """Lengthen a poll delay as far as the budget requires"""
+        pressure = self.pressure()
+        if pressure > 1 and not self._stretching:
+            print(f"Quota: {self.used_today:.0f}/{self.daily_limit} units used; "
+                  f"stretching polls and deferring low-priority replies")
+        elif pressure <= 1 and self._stretching:
+            print("Quota: back within budget")
+        self._stretching = pressure > 1
+        if pressure <= 1:
+            return delay
+        return max(delay, min(self.max_interval, delay * pressure))
+
+    def allow_send(self, priority):
+        """Whether a reply of ``priority`` may be sent now"""
+        if self.used_today >= self.daily_limit:
+            return False
+        return priority <= self.defer_priority or self.pressure() <= 1
+
+    def collect(self):
+        yield 'quota_used_today', {}, self.used_today
+        yield 'quota_remaining', {}, self.daily_limit - self.used_today
+        yield 'quota_burn_rate', {}, self.burn_rate()
+        yield 'quota_pressure', {}, min(self.pressure(), 1e6)
+        exhaustion = self.projected_exhaustion()
+        if exhaustion is not None:
+            yield 'quota_exhaustion_seconds', {}, exhaustion
@@ -0,0 +1,119 @@
+"""Offline replay of recorded chat logs through the bot's message pipeline.
+
+A log is JSON lines, each either one ``liveChatMessages`` item or a whole
+``liveChatMessages.list`` response with an ``items`` list; ``.gz`` logs
+are read transparently. Messages go through the same dedup, command
+matching, throttling and handlers as live chat, and replies through an
+``Outbox`` without a rate limit, so merged and dropped replies are counted.
+The throttle and outbox are clocked by each message's ``publishedAt`` so
+runs are deterministic. Nothing is sent and no credentials or network are
+needed.
+"""
+import collections
+import gzip
+import json
+import time
+
+from dedup import SeenIndex
+from engine import decide
+from messages import parse_items
+from outbox import Outbox
+from throttle import Throttle
+
+
+def read_items(path):
+    """Yield the raw chat items of a recorded log"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'items' in record:
+                yield from record['items']
+            else:
+                yield record
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class _NoLimit:
+    """Stand-in for a ``TokenBucket`` that never makes a send wait"""
+
+    def take(self):
+        return 0
+
+
+def replay(bot, path, show=False, batch_size=1000):
+    """Feed a recorded log through ``bot``; return a Counter of decisions"""
+    seen = SeenIndex()
+    throttle = Throttle()
+    clock = [0.0]
+    outbox = Outbox(_NoLimit(), clock=lambda: clock[0])
+    decisions = collections.Counter()
+    started = time.perf_counter()
+
+    def send_due():
+        while True:
+            reply, _ = outbox.pop()
+            if reply is None:
+                return
+            try:
+                text = reply.render()
+            except Exception as e:
+                print(f"Error rendering reply: {str(e)}")
+                decisions['error'] += 1
+                continue
+            if show:
+                print(f"  -> {text!r}")
+
+    for batch in _batches(read_items(path), batch_size):
+        for message in parse_items(batch):
+            decisions['messages'] += 1
+            now = message.timestamp()
+            clock[0] = max(clock[0], now)
+            send_due()
+            decision, command = decide(bot, seen, throttle, message, now)
+            if decision != 'handle':
+                decisions[decision] += 1
+                continue
+            try:
+                reply = bot.make_reply(command, command.handler(message.author, message.text), message)
+                if reply is not None:
+                    outbox.put(reply)
+            except Exception as e:
+                print(f"Error processing message: {str(e)}")
+                decisions['error'] += 1
+                continue
+            if reply is None:
+                decisions['no reply'] += 1
+                continue
+            decisions[f"reply:{command.name}"] += 1
+            if show:
+                print(f"{message.author}: {message.text!r} -> {reply.text!r}")
+
+    # Let the last merge window close
+    clock[0] += outbox.window
+    send_due()
+    for stat in ('merged', 'dropped', 'sent'):
+        decisions[f"outbox {stat}"] = outbox.stats[stat]
+    decisions['seconds'] = time.perf_counter() - started
+    return decisions
+
+
+def report(decisions):
+    elapsed = decisions.pop('seconds')
+    total = decisions['messages']
+    print(f"Replayed {total} messages in {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f} msg/s)")
+    for decision, count in sorted(decisions.items()):
+        if decision != 'messages':
+            print(f"  {decision:<20} {count}")
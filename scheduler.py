@@ -0,0 +1,88 @@
+import random
+
+# Errors after which polling the chat again is pointless
+FATAL_REASONS = {'liveChatEnded', 'liveChatNotFound', 'liveChatDisabled', 'forbidden'}
+
+
+def error_reasons(error):
+    """The ``reason`` strings of a googleapiclient HttpError, if any"""
+    details = getattr(error, 'error_details', None) or []
+    if isinstance(details, str):
+        return set()
+    return {detail.get('reason') for detail in details if isinstance(detail, dict)}
+
+
+def retry_after(error):
+    """Seconds from a ``Retry-After`` header on an HttpError, or None"""
+    resp = getattr(error, 'resp', None)
+    try:
+        return float(resp.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class PollScheduler:
+    """Decide how long after a poll started the next one should start.
+
+    The server's ``pollingIntervalMillis`` and ``Retry-After`` hints are
+    never undercut. Chats that return no messages are polled progressively
+    slower, up to ``max_idle_interval``, and snap back to the server's rate
+    as soon as messages arrive. Errors back off exponentially with full
+    jitter. A delay of None means the chat is over and polling should stop.
+    """
+
+    def __init__(self, min_interval=0, max_idle_interval=30, idle_growth=1.5,
+                 base_backoff=1, max_backoff=300):
+        self.min_interval = min_interval
+        self.max_idle_interval = max_idle_interval
+        self.idle_growth = idle_growth
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.idle_polls = 0
+
+    def on_success(self, chat_data):
+        self.failures = 0
+        if chat_data.get('offlineAt'):
+            return None
+
+        hint = chat_data.get('pollingIntervalMillis', 5000) / 1000
+        if chat_data.get('items'):
+            self.idle_polls = 0
+            interval = hint
+        else:
+            # Stop counting once the cap is reached, so the power stays
+            # small however long the chat stays quiet
+            if hint * self.idle_growth ** self.idle_polls < self.max_idle_interval:
+                self.idle_polls += 1
+            interval = min(self.max_idle_interval, hint * self.idle_growth ** self.idle_polls)
+        return max(interval, hint, self.min_interval)
+
+    def on_error(self, error):
+        reasons = error_reasons(error)
+        if reasons & FATAL_REASONS:
+            return None
+
+        if self.base_backoff * 2 ** self.failures < self.max_backoff:
+            self.failures += 1
+        if 'quotaExceeded' in reasons:
+            delay = self.max_backoff
+        else:
+            ceiling = min(self.max_backoff, self.base_backoff * 2 ** self.failures)
+            delay = random.uniform(0, ceiling)
+        return max(delay, retry_after(error) or 0, self.min_interval)
+
+
+if __name__ == "__main__":
+    # Regression check: a chat that stays quiet, or keeps failing, for days
+    # must settle at the caps instead of overflowing the backoff power
+    scheduler = PollScheduler(base_backoff=1.0)
+    empty = {'items': [], 'pollingIntervalMillis': 5000}
+    for _ in range(100000):
+        interval = scheduler.on_success(empty)
+    assert interval == scheduler.max_idle_interval, interval
+    assert scheduler.on_success({'items': [{}], 'pollingIntervalMillis': 5000}) == 5
+    for _ in range(100000):
+        delay = scheduler.on_error(Exception())
+    assert 0 <= delay <= scheduler.max_backoff, delay
+    print("PollScheduler stays capped after 100000 empty polls and 100000 errors")
@@ -0,0 +1,242 @@
+"""Spread live chats over several worker processes on one machine.
+
+A ``ShardCoordinator`` assigns video IDs to worker processes, each a
+``YouTubeAPIBot`` serving its share through a ``StreamSupervisor``.
+Assignments are plain streams files under ``<state_dir>/shards``, which
+the workers already re-read when they change. When a worker dies, its videos
+go to the survivors and a replacement is started. A ``LeaseDir`` of
+``flock``-ed files ensures that no two workers ever poll the same
+``liveChatId``, even during a handover. The kernel drops a dead worker's
+locks, so no lease can outlive its holder. API quota is counted in one
+``SharedQuota`` that every worker's ``QuotaPlanner`` charges and plans against.
+"""
+import fcntl
+import math
+import multiprocessing
+import os
+import tempfile
+import time
+
+from metrics import QUOTA_COSTS, metrics
+
+
+class LeaseDir:
+    """Exclusive per-key leases held as ``flock``-ed files in a directory"""
+
+    def __init__(self, path):
+        self.path = path
+        self._held = {}
+        os.makedirs(path, exist_ok=True)
+
+    def acquire(self, key):
+        """Take the lease on ``key`` without waiting; return True if held"""
+        if key in self._held:
+            return True
+        f = open(os.path.join(self.path, f"{key}.lease"), 'a+')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        f.truncate(0)
+        f.write(f"{os.getpid()}\n")
+        f.flush()
+        self._held[key] = f
+        return True
+
+    def release(self, key):
+        f = self._held.pop(key, None)
+        if f is not None:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    def release_all(self):
+        for key in list(self._held):
+            self.release(key)
+
+
+class SharedQuota:
+    """API quota units spent today by every worker, kept in shared memory.
+
+    Has the methods of ``quota.LocalQuota``; the first worker to see a new
+    quota day resets the count for all of them.
+    """
+
+    def __init__(self, context=multiprocessing):
+        self._used = context.Value('q', 0)
+        self._day = context.Value('q', 0, lock=False)
+
+    def charge(self, method):
+        """Add the quota cost of one call to ``method``"""
+        with self._used.get_lock():
+            self._used.value += QUOTA_COSTS.get(method, 1)
+
+    def roll(self, day):
+        with self._used.get_lock():
+            if self._day.value != day:
+                self._day.value = day
+                self._used.value = 0
+
+    def raise_to(self, units):
+        with self._used.get_lock():
+            self._used.value = max(self._used.value, units)
+
+    @property
+    def used(self):
+        return self._used.value
+
+
+def _worker(index, streams_file, state_dir, quota):
+    # Imported here: the coordinator itself never needs the bot or its clients
+    from cache import LookupCache
+    from main import QUOTA_LIMIT, YouTubeAPIBot
+    from quota import QuotaPlanner
+
+    bot = YouTubeAPIBot(state_dir=state_dir)
+    # Credentials and seen indexes are shared; lookups are cached per
+    # worker so workers never overwrite each other's cache file
+    bot.cache = LookupCache(os.path.join(state_dir, 'shards', f"worker-{index}.cache.json"))
+    bot.quota = QuotaPlanner(QUOTA_LIMIT, counter=quota, store=bot.quota.store)
+    bot.run_many([], streams_file, leases=LeaseDir(os.path.join(state_dir, 'leases')))
+
+
+class ShardCoordinator:
+    """Assign video IDs to a pool of worker processes and keep them served.
+
+    Every ``check_interval`` seconds the coordinator restarts dead
+    workers, backing off those that die within ``min_uptime`` seconds. It
+    also re-reads ``streams_file`` if given and rebalances so that no
+    worker holds more than its fair share. A moved stream is
+    released by its old worker before the new one can lease it, so
+    handovers can briefly pause a chat but never duplicate it.
+    """
+
+    def __init__(self, video_ids, workers=4, state_dir='.youbot', streams_file=None,
+                 check_interval=5, min_uptime=60, max_restart_delay=300):
+        self.wanted = list(dict.fromkeys(video_ids))
+        self.workers = workers
+        self.state_dir = state_dir
+        self.streams_file = streams_file
+        self.check_interval = check_interval
+        self.min_uptime = min_uptime
+        self.max_restart_delay = max_restart_delay
+        self.shard_dir = os.path.join(state_dir, 'shards')
+        self.context = multiprocessing.get_context('spawn')
+        self.quota = SharedQuota(self.context)
+        self.processes = [None] * workers
+        self.assignments = [[] for _ in range(workers)]
+        self._written = [None] * workers
+        self._started = [0] * workers
+        self._failures = [0] * workers
+        self._restart_at = [0] * workers
+        self._streams_mtime = None
+
+    def _streams_path(self, index):
+        return os.path.join(self.shard_dir, f"worker-{index}.streams")
+
+    def _write_assignment(self, index):
+        videos = self.assignments[index]
+        if videos == self._written[index]:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.shard_dir, prefix='.streams-')
+        with os.fdopen(fd, 'w') as f:
+            f.write(''.join(f"{video_id}\n" for video_id in videos))
+        os.replace(tmp_path, self._streams_path(index))
+        self._written[index] = list(videos)
+
+    def _start(self, index):
+        process = self.context.Process(
+            target=_worker, name=f"youbot-worker-{index}",
+            args=(index, self._streams_path(index), self.state_dir, self.quota)
+        )
+        process.start()
+        self.processes[index] = process
+        self._started[index] = time.monotonic()
+
+    def _read_streams_file(self):
+        try:
+            mtime = os.path.getmtime(self.streams_file)
+        except OSError:
+            return
+        if mtime == self._streams_mtime:
+            return
+        self._streams_mtime = mtime
+        with open(self.streams_file) as f:
+            videos = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        self.wanted = list(dict.fromkeys(videos))
+
+    def rebalance(self, live):
+        """Assign every wanted video to one of the ``live`` worker indexes"""
+        wanted = set(self.wanted)
+        placed = set()
+        for index in range(self.workers):
+            keep = index in live
+            self.assignments[index] = [v for v in self.assignments[index]
+                                       if keep and v in wanted and v not in placed]
+            placed.update(self.assignments[index])
+        if not live:
+            return
+
+        # Move only what is needed: overflow from workers above the fair
+        # share, plus videos that are new or whose worker died
+        share = math.ceil(len(wanted) / len(live))
+        spare = [video_id for video_id in self.wanted if video_id not in placed]
+        for index in live:
+            spare.extend(self.assignments[index][share:])
+            del self.assignments[index][share:]
+        for video_id in spare:
+            index = min(live, key=lambda i: len(self.assignments[i]))
+            self.assignments[index].append(video_id)
+
+    def check(self):
+        """Restart dead workers, then rebalance and publish assignments"""
+        if self.streams_file:
+            self._read_streams_file()
+        now = time.monotonic()
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                print(f"Worker {index} exited with code {process.exitcode}; reassigning its streams")
+                # Back off workers that keep dying, e.g. on bad credentials
+                quick = now - self._started[index] < self.min_uptime
+                self._failures[index] = self._failures[index] + 1 if quick else 0
+                self._restart_at[index] = now + min(self.max_restart_delay,
+                                                    self.check_interval * 2 ** self._failures[index])
+                self.processes[index] = None
+        live = [index for index, process in enumerate(self.processes) if process is not None]
+        # Survivors take over first; replacements get work on a later check
+        self.rebalance(live)
+        for index in range(self.workers):
+            self._write_assignment(index)
+        for index, process in enumerate(self.processes):
+            if process is None and now >= self._restart_at[index]:
+                self._start(index)
+
+    def _collect(self):
+        return [
+            ('quota_units_shared', {}, self.quota.used),
+            ('shard_workers_alive', {}, sum(1 for p in self.processes if p and p.is_alive())),
+        ] + [('shard_streams', {'worker': str(index)}, len(videos))
+             for index, videos in enumerate(self.assignments)]
+
+    def run(self):
+        """Start the workers and supervise them until interrupted"""
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self.rebalance(list(range(self.workers)))
+        for index in range(self.workers):
+            self._write_assignment(index)
+            self._start(index)
+        metrics.add_collector(self._collect)
+        print(f"Coordinating {len(self.wanted)} streams across {self.workers} workers")
+        try:
+            while True:
+                time.sleep(self.check_interval)
+                self.check()
+        finally:
+            metrics.remove_collector(self._collect)
+            # Workers share the terminal and stop on Ctrl+C themselves;
+            # anything still running after a grace period is terminated
+            for process in self.processes:
+                if process is not None:
+                    process.join(10)
+                    if process.is_alive():
+                        process.terminate()
@@ -0,0 +1,60 @@
+import time
+
+
+class Throttle:
+    """Per-viewer spam limits and per-command cooldowns for one chat.
+
+    Each viewer, keyed by channel ID, gets at most ``user_limit`` replies per
+    ``window`` seconds. The count uses a sliding window estimated from
+    two fixed time buckets. Counts for a bucket are dropped wholesale once
+    it is two windows old, so memory only covers recently active viewers
+    and is capped at ``max_users`` per bucket. A command's ``cooldown`` is
+    the minimum time between two replies to it from anyone.
+    """
+
+    def __init__(self, user_limit=3, window=30, max_users=50000):
+        self.user_limit = user_limit
+        self.window = window
+        self.max_users = max_users
+        self.bucket_start = 0
+        self._current = {}
+        self._previous = {}
+        self._last_fired = {}
+        self.dropped = 0
+
+    def __len__(self):
+        """Viewers counted in the current bucket"""
+        return len(self._current)
+
+    def _rotate(self, now):
+        start = now - now % self.window
+        if start != self.bucket_start:
+            adjacent = start - self.bucket_start == self.window
+            self._previous = self._current if adjacent else {}
+            self._current = {}
+            self.bucket_start = start
+
+    def allow(self, user, command, now=None):
+        """Return True and record the reply if ``user`` may trigger ``command`` now"""
+        if now is None:
+            now = time.time()
+        cooldown = getattr(command, 'cooldown', 0)
+        last = self._last_fired.get(command.name)
+        if cooldown and last is not None and now - last < cooldown:
+            self.dropped += 1
+            return False
+
+        self._rotate(now)
+        count = self._current.get(user, 0)
+        previous = self._previous.get(user)
+        estimate = count
+        if previous:
+            estimate += previous * (1 - (now - self.bucket_start) / self.window)
+        if estimate >= self.user_limit or (not count and len(self._current) >= self.max_users):
+            self.dropped += 1
+            return False
+
+        self._current[user] = count + 1
+        if cooldown:
+            self._last_fired[command.name] = now
+        return True
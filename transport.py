@@ -0,0 +1,83 @@
+import copy
+import threading
+
+
+class RequestsTransport:
+    """HTTP transport backed by one pooled, keep-alive ``requests`` session.
+
+    googleapiclient only needs an object with an httplib2-style
+    ``request(uri, method, body, headers)`` returning ``(response, content)``.
+    A urllib3 connection pool is thread-safe, so the poll and send threads
+    share warm sockets instead of paying a TLS handshake per call.
+    """
+
+    def __init__(self, credentials=None, pool_size=16, timeout=30, session=None):
+        from requests.adapters import HTTPAdapter
+        if session is None:
+            if credentials is None:
+                from requests import Session
+                session = Session()
+            else:
+                from google.auth.transport.requests import AuthorizedSession
+                session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        self.session = session
+        self.timeout = timeout
+
+    def with_timeout(self, timeout):
+        """A view of this transport, sharing its pool, with another timeout"""
+        view = copy.copy(self)
+        view.timeout = timeout
+        return view
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, **kwargs):
+        import httplib2
+        response = self.session.request(
+            method, uri, data=body, headers=headers,
+            timeout=self.timeout, allow_redirects=redirections > 0
+        )
+        info = {key.lower(): value for key, value in response.headers.items()}
+        info['status'] = str(response.status_code)
+        return httplib2.Response(info), response.content
+
+    def close(self):
+        self.session.close()
+
+
+class Httplib2Transport:
+    """googleapiclient's default httplib2 transport, made safe to share.
+
+    httplib2 is not thread-safe, so every thread (and timeout) gets its own
+    ``Http`` object and connections.
+    """
+
+    def __init__(self, credentials=None, timeout=30):
+        self.credentials = credentials
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def with_timeout(self, timeout):
+        view = copy.copy(self)
+        view.timeout = timeout
+        return view
+
+    def _http(self):
+        pool = self._local.__dict__.setdefault('http', {})
+        http = pool.get(self.timeout)
+        if http is None:
+            import httplib2
+            http = httplib2.Http(timeout=self.timeout)
+            if self.credentials is not None:
+                from google_auth_httplib2 import AuthorizedHttp
+                http = AuthorizedHttp(self.credentials, http=http)
+            pool[self.timeout] = http
+        return http
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        return self._http().request(uri, method, body=body, headers=headers, **kwargs)
+
+    def close(self):
+        for http in self._local.__dict__.get('http', {}).values():
+            http.close()